@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import warnings
+import time
+import shutil
+import tempfile
+import contextlib
+import subprocess
+import pandas as pd
+import get_new_storms
+import stormselection
+import synthetic_data
+from pipeline import site_paths
+from neon_io import frame_path, read_frame, apply_schema, load_catalog
+from instrument import SETTINGS, COUNTERS, configure, measure
+## This program times and memory-profiles each stage of get_new_storms.py and
+## stormselection.py on synthetic NEON data (see synthetic_data.py). Every run is added to
+## a results file with the git commit it ran on, so stage times can be compared across
+## commits.
+
+# This function returns the git commit of the repository, with '+' added when tracked
+# files have changes that are not committed ('unknown' when git is not available).
+def git_commit():
+    folder = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=folder, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        changes = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=folder,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('+' if changes else '')
+
+# This function returns the stages of the pipeline in the order they run, as a list of
+# (name, function) pairs. Each function runs its stage for all Sites. The download folders
+# are read in place by the catalog (the former flatten and filter steps).
+# Inputs: paths = dict of folders (see pipeline.site_paths), Sites = list of sites, date =
+# date tag of the combined files, fmt = format of the intermediate files
+def pipeline_stages(paths, Sites, date, fmt='csv'):
+    catalogs = {}
+
+    def catalog():
+        catalogs['precip'] = load_catalog(paths['precip_raw'])
+        catalogs['air'] = load_catalog(paths['air_raw'])
+
+    def concat_precip():
+        get_new_storms.concatPrecip(Sites, paths['precip_raw'], paths['precip'], date, fmt, False, catalogs['precip'])
+
+    def concat_tf():
+        for sensor in range(1, 6):
+            get_new_storms.concatTF(Sites, paths['precip_raw'], paths['tf_concat'], str(sensor), fmt, False,
+                                    catalogs['precip'])
+
+    def combine_tf():
+        get_new_storms.combineTF(Sites, paths['tf_concat'], paths['tf'], date, fmt)
+
+    def staging():
+        for site in Sites:
+            get_new_storms.staging(frame_path(paths['precip']+'Combined_Allprecip_'+site+date, fmt),
+                                   frame_path(paths['tf']+'Combined_allTF_'+site+date, fmt), site,
+                                   paths['staging'], fmt)
+
+    def combine_air():
+        stormselection.combine_air(Sites, paths['air_raw'], paths['air'], fmt, False, catalogs['air'])
+
+    def storm_select():
+        stormselection.storm_select(Sites, paths['air'], paths['staging'], paths['selected'], fmt)
+
+    return [('catalog', catalog), ('concatPrecip', concat_precip), ('concatTF', concat_tf),
+            ('combineTF', combine_tf), ('staging', staging), ('combine_air', combine_air),
+            ('storm_select', storm_select)]
+
+# This function runs every stage once and returns the record of each stage from
+# instrument.measure: wall time, CPU time, files, bytes and rows read, rows written,
+# storms and, when memory is set, the peak memory. tracemalloc slows the stages down, so
+# memory is measured in a separate run.
+def run_stages(stages, memory=False):
+    settings = dict(SETTINGS)
+    configure(memory=memory, quiet=True)
+    results = {}
+    try:
+        for name, stage in stages:
+            # the stages print progress for every site
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                with measure(name) as record:
+                    stage()
+            results[name] = record
+    finally:
+        configure(**settings)
+    return results
+
+# This function benchmarks the pipeline stages on synthetic data and adds the results to
+# a results file.
+# Inputs: main_dir = folder for the synthetic downloads and the stage outputs (the
+# downloads are kept and only written again when Sites or years change), Sites = list of
+# site codes, years = years of data per site, fmt = format of the intermediate files,
+# repeat = number of timed runs (the fastest is kept), memory = also measure the peak
+# memory of each stage, results_path = JSON lines file the results are added to (None
+# does not save them)
+# Output: dataframe with one row per stage
+def run_benchmark(main_dir, Sites, years=1, fmt='csv', repeat=3, memory=True, results_path=None):
+    paths = site_paths(main_dir)
+    data = {'sites': Sites, 'years': years, 'generator': synthetic_data.SYNTHETIC_RELEASE}
+    data_file = main_dir+'synthetic.json'
+    written = None
+    if os.path.isfile(data_file):
+        with open(data_file) as f:
+            written = json.load(f)
+    if written != data:
+        shutil.rmtree(main_dir+'NEON_Downloads/', ignore_errors=True)
+        synthetic_data.write_sites(paths['precip_raw'], Sites, years, air_folder=paths['air_raw'])
+        with open(data_file, 'w') as f:
+            json.dump(data, f)
+
+    runs = []
+    for number in range(repeat + memory):
+        for folder in ['Combined', 'Staging', 'Selected_Storms', 'Cache']:
+            shutil.rmtree(main_dir+folder, ignore_errors=True)
+        for key in ['precip', 'tf_concat', 'tf', 'staging', 'air', 'selected']:
+            os.makedirs(paths[key], exist_ok=True)
+        runs.append(run_stages(pipeline_stages(paths, Sites, 'bench', fmt), memory and number == repeat))
+
+    commit = git_commit()
+    stamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+    results = []
+    for name in runs[0]:
+        timed = [run[name] for run in runs[:max(repeat, 1)]]
+        result = {'commit': commit, 'time': stamp, 'stage': name, 'sites': len(Sites), 'years': years, 'fmt': fmt,
+                  'wall_s': min(run['wall_s'] for run in timed), 'cpu_s': min(run['cpu_s'] for run in timed),
+                  'peak_mb': runs[-1][name].get('peak_mb')}
+        result.update({counter: runs[0][name][counter] for counter in COUNTERS})
+        results.append(result)
+    if results_path is not None:
+        with open(results_path, 'a') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+    return pd.DataFrame(results)
+
+# This function reads a results file and returns the fastest wall time of each stage per
+# commit, for one data size and format, with the commits in the order they were run.
+# The 'change' column is the wall time of the last commit relative to the one before it.
+def compare_results(results_path, sites=None, years=None, fmt=None):
+    results = pd.read_json(results_path, lines=True)
+    for col, value in [('sites', sites), ('years', years), ('fmt', fmt)]:
+        if value is not None:
+            results = results[results[col] == value]
+    commits = list(dict.fromkeys(results['commit']))
+    table = results.pivot_table(index='stage', columns='commit', values='wall_s', aggfunc='min', sort=False)
+    table = table[commits]
+    if len(commits) > 1:
+        table['change'] = table[commits[-1]] / table[commits[-2]]
+    return table
+
+# This function loads the per-site frames of all sites together, once with the pandas
+# defaults and once with the neon_io schemas (float32 precip, TF and air temp, UTC
+# timestamps, categorical site code, uint8 filter results), and returns the memory each
+# takes. Run it after run_benchmark, on the stage outputs of its last run.
+# Inputs: main_dir, Sites, fmt = see run_benchmark, date = date tag of the combined files
+# Output: dataframe with one row per kind of frame and a total row: rows, memory in MB
+# with the pandas defaults and with the schema, and their ratio
+def frame_memory(main_dir, Sites, fmt='csv', date='bench'):
+    paths = site_paths(main_dir)
+    kinds = {'precip': lambda site: frame_path(paths['precip']+'Combined_Allprecip_'+site+date, fmt),
+             'tf': lambda site: frame_path(paths['tf']+'Combined_allTF_'+site+date, fmt),
+             'air': lambda site: frame_path(paths['air']+'Combined_airTemp_'+site, fmt),
+             'storms': lambda site: frame_path(paths['staging']+'Output_'+site, fmt),
+             'selected': lambda site: paths['selected']+'all_storms_'+site+'_filter_index.csv'}
+    results = []
+    for kind, path in kinds.items():
+        files = [path(site) for site in Sites if os.path.isfile(path(site))]
+        if len(files) == 0:
+            continue
+        default = pd.concat([pd.read_csv(file) if file.endswith('.csv') else pd.read_parquet(file) for file in files],
+                            ignore_index=True)
+        # the site categories are joined after the sites are put together
+        storms = kind in ['storms', 'selected']
+        compact = apply_schema(pd.concat([read_frame(file, storms=storms) for file in files], ignore_index=True), storms)
+        results.append({'frame': kind, 'rows': len(default), 'default_mb': default.memory_usage(deep=True).sum() / 2**20,
+                        'schema_mb': compact.memory_usage(deep=True).sum() / 2**20})
+    results = pd.DataFrame(results)
+    results.loc[len(results)] = ['total', results['rows'].sum(), results['default_mb'].sum(), results['schema_mb'].sum()]
+    results['ratio'] = results['schema_mb'] / results['default_mb']
+    return results
+
+
+if __name__ == "__main__":
+    # Folder for the synthetic data and the stage outputs, and the file the results are
+    # added to on every run
+    main_dir = os.path.join(tempfile.gettempdir(), 'neon_benchmark/')
+    results_path = main_dir+'benchmark_results.jsonl'
+    Sites = ['BART', 'HARV']
+    years = 2
+    fmt = 'csv'
+    if len(sys.argv) > 1:
+        # python benchmark.py <site,site,...> [years] [csv|parquet]
+        Sites = sys.argv[1].split(',')
+        years = int(sys.argv[2]) if len(sys.argv) > 2 else years
+        fmt = sys.argv[3] if len(sys.argv) > 3 else fmt
+
+    os.makedirs(main_dir, exist_ok=True)
+    print(run_benchmark(main_dir, Sites, years, fmt, results_path=results_path).to_string(index=False))
+    print(compare_results(results_path, len(Sites), years, fmt).to_string())
+    print(frame_memory(main_dir, Sites, fmt).to_string(index=False))
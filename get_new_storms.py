@@ -1,202 +1,176 @@
 import os
+import re
+import warnings
 import numpy as np
 import glob
 import pandas as pd
-import shutil
-from pathlib import Path
+from instrument import debug, count
+from neon_io import frame_path, read_frame, read_neon, parse_times, time_slots, slot_grid, grid_frame, merge_grids, save_grid, load_grid, load_catalog, catalog_records, catalog_files, write_frame, append_frame, load_manifest, save_manifest, new_files, mark_ingested
 ## This program includes functions to take raw downloaded NEON precipitation and
 ## throughfall data and outputs a file with defined storms for each site in a given
 ## list. The functions also calculate duration and interception loss for each storm.
 
-# This function flattens the file structure of the downloaded files from NEON.
-def flatten(destination):
-    all_files = []
-    first_loop_pass = True
-    for root, _dirs, files in os.walk(destination):
-        if first_loop_pass:
-            first_loop_pass = False
-            continue
-        for filename in files:
-            if not 'readme' in filename and not 'sensor_positions' in filename and not 'variables' in filename:
-                #if not 'sensor_positions' and not 'variables' in filename:
-                all_files.append(os.path.join(root, filename))
-    for filename in all_files:
-        shutil.move(filename, destination)
-    print("Files flattened")
-
-# This function moves only the 30 minute files from the flattened NEON folder
-# into the resource folder. Filter string should be '30min'.
-def filter(source, destination, filter_string):
-    files = os.listdir(source)
-    for file in files:
-        if filter_string in file:
-            file_name = os.path.join(source, file)
-            shutil.move(file_name, destination)
-    print("Files filtered")
+# Settings of the storm definition in staging (in 30 min increments). storm_gap = minimum
+# dry period between the wet runs of a storm, gap = window before the next storm start
+# that joins it to the storm before it when it holds any precip or TF, storm_len = storms
+# must be longer than this.
+STORM_PARAMS = {'gap': 12, 'storm_gap': 6, 'storm_len': 0}
+
+# Columns of the combined precip files (end times of the primary and secondary precip files).
+PRECIP_COLS = ['startDateTime', 'endDateTime_x', 'priPrecipBulk', 'endDateTime_y', 'secPrecipBulk']
 
 # This function concatenates all monthly precip files per site into one file.
-def concatPrecip(Sites, dir, output_folder,date):
-    os.chdir(dir)
+    # fmt = format of the combined file ('csv' or 'parquet'), incremental = only read
+    # monthly files not ingested in an earlier run and add them to the combined file,
+    # catalog = catalog of dir from load_catalog (None scans dir once for all sites)
+def concatPrecip(Sites, dir, output_folder,date, fmt='csv', incremental=False, catalog=None):
+    if catalog is None:
+        catalog = load_catalog(dir)
     for site in Sites:
         secP = 0
         priP = 0
 
-        all_filenames_pri = [i for i in glob.glob('NEON.*.'+site+'*.PRIPRE_30min.*.csv')]
+        records_pri = catalog_records(catalog, site, 'PRIPRE_30min')
+        records_sec = catalog_records(catalog, site, 'SECPRE_30min')
+        all_filenames_pri = [record['file'] for record in records_pri]
+        all_filenames_sec = [record['file'] for record in records_sec]
+        if incremental:
+            combined = frame_path(output_folder+'Combined_Allprecip_' + site + date, fmt)
+            manifest = load_manifest(output_folder, site, {'PRIPRE': combined, 'SECPRE': combined})
+            new_pri = new_files(manifest, 'PRIPRE', all_filenames_pri)
+            new_sec = new_files(manifest, 'SECPRE', all_filenames_sec)
+            if len(new_pri) == 0 and len(new_sec) == 0:
+                print('No new precip files for', site)
+                continue
+            # Both products are read again for every month with a new file of either one,
+            # so the rows that replace the rows of those months keep the values of the
+            # product that did not change.
+            months = {record['month'] for record in records_pri + records_sec if record['file'] in new_pri + new_sec}
+            all_filenames_pri = [record['file'] for record in records_pri if record['month'] in months]
+            all_filenames_sec = [record['file'] for record in records_sec if record['month'] in months]
+
         if (len(all_filenames_pri) == 0):
+                # a product that was ingested before has no file for the new months, the
+                # rows of those months are left as they are until it does
+                if incremental and len(manifest.get('PRIPRE', {})) > 0:
+                    print('No priPrecip for', site, 'in', sorted(months))
+                    continue
                 print('No priPrecip for', site)
                 priP = 1
         else:
-                combined_pri = pd.concat([pd.read_csv(f, engine='python') for f in all_filenames_pri])
+                combined_pri = read_neon(all_filenames_pri, 'priPrecipBulk')
 
-        all_filenames_sec = [i for i in glob.glob('NEON.*.'+site+'*.SECPRE_30min.*.csv')]
         if (len(all_filenames_sec) == 0):
+            if incremental and len(manifest.get('SECPRE', {})) > 0:
+                print('No secPrecip for', site, 'in', sorted(months))
+                continue
             print('No secPrecip for', site)
             secP = 1
         else:
-            combined_sec = pd.concat([pd.read_csv(f, engine='python') for f in all_filenames_sec])
+            combined_sec = read_neon(all_filenames_sec, 'secPrecipBulk')
 
         # Combine secondary and primary precip concatenated files into one csv.
           # If there are no data for sec or pri precip, fill in the column with zeros.
           # If there are no sec or pri precip data, print a statement indicating no precip data at that site.
         if priP == 0 and secP == 0:
             df_comb = pd.merge(combined_pri, combined_sec, on='startDateTime')
-            df_comb.to_csv(output_folder+'Combined_Allprecip_' + site + date+'.csv',
-                           index=False,
-                           encoding='utf-8-sig')
         elif priP == 0 and secP == 1:
-            df_comb = combined_pri
+            df_comb = combined_pri.rename(columns={'endDateTime': 'endDateTime_x'})
+            df_comb['endDateTime_y'] = pd.NaT
             df_comb['secPrecipBulk'] = 0
-            df_comb.to_csv(output_folder+'Combined_Allprecip_' + site + date+'.csv',
-                           index=False,
-                           encoding='utf-8-sig')
         elif secP == 0 and priP == 1:
-            df_comb = combined_sec
+            df_comb = combined_sec.rename(columns={'endDateTime': 'endDateTime_y'})
+            df_comb['endDateTime_x'] = pd.NaT
             df_comb['priPrecipBulk'] = 0
-            df_comb.to_csv(output_folder+'Combined_Allprecip_' + site + date+'.csv',
-                           index=False,
-                           encoding='utf-8-sig')
         elif priP == 1 and secP == 1:
             print('NO PRECIP DATA FOR', site)
+            continue
+        # the same columns in the same order whichever products were found, so rows
+        # appended to the file line up with the rows in it
+        df_comb = df_comb[PRECIP_COLS]
+
+        if incremental:
+            append_frame(df_comb, output_folder+'Combined_Allprecip_' + site + date, fmt)
+            mark_ingested(manifest, 'PRIPRE', new_pri)
+            mark_ingested(manifest, 'SECPRE', new_sec)
+            save_manifest(manifest, output_folder, site)
+        else:
+            write_frame(df_comb, output_folder+'Combined_Allprecip_' + site + date, fmt)
 
 
 # This function concatenates all the TF sensor values for one TF sensor
-# at a time (TF_sensor can be 1-5).
-def concatTF(Sites, dir, output_folder, TF_sensor):
-    os.chdir(dir)
+# at a time (TF_sensor can be 1-5). fmt = format of the concatenated file ('csv' or 'parquet'),
+# incremental = only read monthly files not ingested in an earlier run and add them to the file,
+# catalog = catalog of dir from load_catalog (None scans dir once for all sites)
+def concatTF(Sites, dir, output_folder, TF_sensor, fmt='csv', incremental=False, catalog=None):
+    if catalog is None:
+        catalog = load_catalog(dir)
     for site in Sites:
-        all_filenames_tf = [i for i in glob.glob('NEON.*.' + site + '*' + TF_sensor + '.000.030.THRPRE_30min.*.csv')]
+        all_filenames_tf = catalog_files(catalog, site, 'THRPRE_30min', '00' + TF_sensor + '.000')
         #TF_sensor = '1'
+        if incremental:
+            manifest = load_manifest(output_folder, site,
+                                     {'THRPRE' + TF_sensor: frame_path(output_folder + 'TF'+ TF_sensor +'_' + site, fmt)})
+            ingested = len(manifest.get('THRPRE' + TF_sensor, {}))
+            all_filenames_tf = new_files(manifest, 'THRPRE' + TF_sensor, all_filenames_tf)
+            if len(all_filenames_tf) == 0 and ingested > 0:
+                print('No new TF' + TF_sensor + ' files for', site)
+                continue
         if (len(all_filenames_tf) == 0):
             print('No TF' +TF_sensor+ ' for', site)
         else:
-            combined_csv_tf = pd.concat([pd.read_csv(f, engine='python') for f in all_filenames_tf])
+            combined_csv_tf = read_neon(all_filenames_tf, 'TFPrecipBulk')
             # export to csv
-            combined_csv_tf.to_csv(output_folder + 'TF'+ TF_sensor +'_' + site + '.csv', index=False, encoding='utf-8-sig')
+            if incremental:
+                append_frame(combined_csv_tf, output_folder + 'TF'+ TF_sensor +'_' + site, fmt)
+                mark_ingested(manifest, 'THRPRE' + TF_sensor, all_filenames_tf)
+                save_manifest(manifest, output_folder, site)
+            else:
+                write_frame(combined_csv_tf, output_folder + 'TF'+ TF_sensor +'_' + site, fmt)
+
+# This function aligns the series of any number of TF collectors on one 30 minute time
+# index running from the first to the last timestamp of any collector. Each collector is
+# matched to the index by its timestamps, so a collector with missing months gets NaN
+# for those slots instead of shifting the rows that follow.
+    # Inputs: frames = dict of collector name (e.g. 'TF1') -> dataframe with startDateTime
+    # and TFPrecipBulk, freq = time step of the index
+def align_collectors(frames, freq='30min'):
+    starts = {name: parse_times(frame['startDateTime']) for name, frame in frames.items()}
+    index = pd.date_range(min(start.min() for start in starts.values()),
+                          max(start.max() for start in starts.values()), freq=freq, name='startDateTime')
+    columns = {}
+    for name, frame in frames.items():
+        values = pd.Series(frame['TFPrecipBulk'].to_numpy(), index=starts[name])
+        columns[name] = values[~values.index.duplicated(keep='last')].reindex(index)
+    combinedTF_df = pd.DataFrame(columns, index=index).reset_index()
+    combinedTF_df.insert(1, 'endDateTime', combinedTF_df['startDateTime'] + pd.Timedelta(freq))
+    return combinedTF_df
 
 # This function combines each of the concatenated TF sensor files into one csv.
     # Inputs: Site = list of sites, dir = directory to concatenated TF files,
-    # output_fodler = directory where you want to store output combined csv files
-def combineTF(Sites, dir, output_folder,date):
+    # output_fodler = directory where you want to store output combined csv files,
+    # fmt = format of the concatenated and combined files ('csv' or 'parquet'),
+    # collectors = number of TF collectors per site. Collectors without a file are set to 0.
+def combineTF(Sites, dir, output_folder,date, fmt='csv', collectors=5):
     for site in Sites:
-        no1 = 0
-        no2 = 0
-        no3 = 0
-        no4 = 0
-        combinedTF_df = pd.DataFrame()
-        all_filenames_tf1 = [i for i in
-                             glob.glob(dir+'TF1_' + site + '.csv')]
-        if (len(all_filenames_tf1) == 0):
-            print('No TF1 for', site)
-            no1 = 1
-        else:
-            # read in concatenated csv
-            combined_csv_tf1 = pd.read_csv(dir+'TF1_' + site + '.csv')
-            # set column of combined dataframe to values from concatenated TF1 file
-            combinedTF_df['startDateTime'] = combined_csv_tf1['startDateTime']
-            combinedTF_df['endDateTime'] = combined_csv_tf1['endDateTime']
-            combinedTF_df['TF1'] = combined_csv_tf1['TFPrecipBulk']
-
-        all_filenames_tf2 = [i for i in
-                             glob.glob(dir+'TF2_' + site + '.csv')]
-        if (len(all_filenames_tf2) == 0):
-            print('No TF2 for', site)
-            no2 = 1
-            if no1 == 0:
-                combinedTF_df['TF2'] = 0
-        elif no1 == 0 and not (len(all_filenames_tf2) == 0):
-            # read in concatenated csv
-            combined_csv_tf2 = pd.read_csv(dir+'TF2_' + site + '.csv')
-            # set column of combined dataframe to values from concatenated TF2 file
-            combinedTF_df['TF2'] = combined_csv_tf2['TFPrecipBulk']
-        elif no1 == 1 and not (len(all_filenames_tf2) == 0):
-            # read in concatenated csv
-            combined_csv_tf2 = pd.read_csv(dir + 'TF2_' + site + '.csv')
-            # set columns of combined dataframe to values from concatenated TF2 file
-            combinedTF_df['startDateTime'] = combined_csv_tf2['startDateTime']
-            combinedTF_df['endDateTime'] = combined_csv_tf2['endDateTime']
-            combinedTF_df['TF2'] = combined_csv_tf2['TFPrecipBulk']
-
-        all_filenames_tf3 = [i for i in
-                             glob.glob(dir+'TF3_' + site + '.csv')]
-        if (len(all_filenames_tf3) == 0):
-            print('No TF3 for', site)
-            no3 = 1
-            if no1 == 0 or no2 == 0:
-                combinedTF_df['TF3'] = 0
-        elif no1 == 0 or no2 == 0 and not (len(all_filenames_tf3) == 0):
-            # read in concatenated csv
-            combined_csv_tf3 = pd.read_csv(dir+'TF3_' + site + '.csv')
-            # set column of combined dataframe to values from concatenated TF3 file
-            combinedTF_df['TF3'] = combined_csv_tf3['TFPrecipBulk']
-        elif no1 == 1 and no2 == 1 and not (len(all_filenames_tf3) == 0):
-            # read in concatenated csv
-            combined_csv_tf3 = pd.read_csv(dir + 'TF3_' + site + '.csv')
-            # set column of combined dataframe to values from concatenated TF3 file
-            combinedTF_df['startDateTime'] = combined_csv_tf3['startDateTime']
-            combinedTF_df['endDateTime'] = combined_csv_tf3['endDateTime']
-            combinedTF_df['TF3'] = combined_csv_tf3['TFPrecipBulk']
-
-        all_filenames_tf4 = [i for i in
-                             glob.glob(dir+'TF4_' + site + '.csv')]
-        if (len(all_filenames_tf4) == 0):
-            print('No TF4 for', site)
-            no4 = 1
-            if no1 == 0 or no2 == 0 or no3 == 0:
-                combinedTF_df['TF4'] = 0
-        elif no1 == 0 or no2 == 0 or no3 == 0 and not (len(all_filenames_tf4) == 0):
-            # read in concatenated csv
-            combined_csv_tf4 = pd.read_csv(dir+'TF4_' + site + '.csv')
-            # set column of combined dataframe to values from concatenated TF4 file
-            combinedTF_df['TF4'] = combined_csv_tf4['TFPrecipBulk']
-        elif no1 == 1 and no2 == 1 and no3 == 1 and not (len(all_filenames_tf4) == 0):
-            # read in concatenated csv
-            combined_csv_tf4 = pd.read_csv(dir+'TF4_' + site + '.csv')
-            # set column of combined dataframe to values from concatenated TF4 file
-            combinedTF_df['startDateTime'] = combined_csv_tf4['startDateTime']
-            combinedTF_df['endDateTime'] = combined_csv_tf4['endDateTime']
-            combinedTF_df['TF4'] = combined_csv_tf4['TFPrecipBulk']
-
-        all_filenames_tf5 = [i for i in
-                             glob.glob(dir+'TF5_' + site + '.csv')]
-        if (len(all_filenames_tf5) == 0):
-            print('No TF5 for', site)
-            if no1 == 0 or no2 == 0 or no3 == 0 or no4 == 0:
-                combinedTF_df['TF5'] = 0
-        elif no1 == 0 or no2 == 0 or no3 == 0 or no4 == 0 and not (len(all_filenames_tf5) == 0):
-            # read in concatenated csv
-            combined_csv_tf5 = pd.read_csv(dir+'TF5_' + site + '.csv')
-            # set column of combined dataframe to values from concatenated TF5 file
-            combinedTF_df['TF5'] = combined_csv_tf5['TFPrecipBulk']
-        elif no1 == 1 and no2 == 1 and no3 == 1 and no4 == 1 and not (len(all_filenames_tf5) == 0):
-            # read in concatenated csv
-            combined_csv_tf5 = pd.read_csv(dir+'TF5_' + site + '.csv')
-            # set column of combined dataframe to values from concatenated TF5 file
-            combinedTF_df['startDateTime'] = combined_csv_tf5['startDateTime']
-            combinedTF_df['endDateTime'] = combined_csv_tf5['endDateTime']
-            combinedTF_df['TF5'] = combined_csv_tf5['TFPrecipBulk']
+        names = ['TF' + str(sensor) for sensor in range(1, collectors + 1)]
+        frames = {}
+        for name in names:
+            file = frame_path(dir + name + '_' + site, fmt)
+            if os.path.isfile(file):
+                frames[name] = read_frame(file, columns=['startDateTime', 'TFPrecipBulk'])
+            else:
+                print('No ' + name + ' for', site)
+        if len(frames) == 0:
+            print('No TF data for', site)
+            continue
 
+        combinedTF_df = align_collectors(frames)
+        for name in names:
+            if name not in frames:
+                combinedTF_df[name] = 0
         # write dataframe with all concatenated TF sensor data to one csv
-        combinedTF_df.to_csv(output_folder+'Combined_allTF_' + site + date+'.csv', index=False, encoding='utf-8-sig')
+        write_frame(combinedTF_df[['startDateTime', 'endDateTime'] + names], output_folder+'Combined_allTF_' + site + date, fmt)
 
 # The below functions will define storm events from the TF and precip data.
     # Inputs: a = the dataframe column that contains the precip data.
@@ -205,240 +179,312 @@ def zero_runs(a):
     iszero = np.concatenate(([0], np.not_equal(a, 0).view(np.int8), [0]))
     absdiff = np.abs(np.diff(iszero))
     ranges = np.where(absdiff == 1)[0].reshape(-1, 2)
-    print('ranges', ranges)
+    debug('ranges', ranges)
     return ranges
 
     # Inputs: zero_trail = the ouput of the zero_runs function.
     # storm_len = minimum length of the storm (in 30 min increments)
     # storm_gap = mininum dry period between storms (in 30 min increments)
 def storm_event(zero_trail, storm_len, storm_gap):
-    diffin = np.array([zero_trail[i + 1][0] - zero_trail[i][1] for i in range(len(zero_trail) - 1)] + [-1])
-    empty_array = np.empty((0, 2), int)
+    zero_trail = np.asarray(zero_trail).reshape(-1, 2)
     if len(zero_trail) == 0:
-        return empty_array
-    start, end = zero_trail[0]
-    for i, j in zip(zero_trail, diffin):
-        end = i[1]
-        if j > storm_gap:
-            if end - start > storm_len:
-                empty_array = np.append(empty_array, np.array([[start, end]]), axis=0)
-            start = end + j
-        elif j == -1:
-            if i[1] - i[0] > storm_len:
-                empty_array = np.append(empty_array, np.array([[i[0], i[1]]]), axis=0)
-    return empty_array
+        return np.empty((0, 2), int)
+    # A new storm starts after every dry gap longer than storm_gap. Each storm spans
+    # the min start to the max end of the wet runs grouped into it.
+    diffin = zero_trail[1:, 0] - zero_trail[:-1, 1]
+    new_storm = np.concatenate(([True], diffin > storm_gap))
+    first = np.flatnonzero(new_storm)
+    storms = np.column_stack((np.minimum.reduceat(zero_trail[:, 0], first),
+                              np.maximum.reduceat(zero_trail[:, 1], first)))
+    # The last storm only keeps the final wet run, as the original loop did.
+    storms[-1] = zero_trail[-1]
+    return storms[storms[:, 1] - storms[:, 0] > storm_len]
+
+# This function joins the storms from storm_event the way agg_prec does, and returns the
+# window of each storm. Storms are joined when there is precip or TF in the gap window
+# [k - gap, k - 1) before the next storm start k. Prefix sums of precip and every TF column
+# test all gap windows at once, and each run of joined storms collapses to the first start
+# and the last end. Each storm window runs from the storm start to the start of the next
+# storm, or to the end of the last wet run for the final storm, so the windows include the
+# TF that drips after the rain.
+    # Inputs: storms = output of storm_event, gap_csum = prefix sums of the precip and TF
+    # columns with a row of zeros first, gap = see agg_prec
+    # Output: storms = (start, end) rows of the joined storms, ends = end of each storm window
+def storm_windows(storms, gap_csum, gap):
+    k = storms[1:, 0]
+    m = np.maximum(k - gap, 0)
+    wet_gap = ((gap_csum[np.maximum(k - 1, m)] - gap_csum[m]) > 0).any(axis=1)
+    first = np.flatnonzero(np.concatenate(([True], ~wet_gap)))
+    last = np.append(first[1:] - 1, len(storms) - 1)
+    storms = np.column_stack((storms[first, 0], storms[last, 1]))
+    ends = np.append(storms[1:, 0], storms[-1:, 1])
+    return storms, ends
+
+# This function returns the prefix sums of columns of a dataframe, with missing values as
+# zero and a row of zeros first, so the sum of rows [a, b) is csum[b] - csum[a].
+def prefix_sums(df, cols):
+    # the float32 slot values are summed in float64
+    csum = np.cumsum(np.nan_to_num(df[cols].to_numpy().astype('float64')), axis=0)
+    return np.vstack([np.zeros((1, len(cols))), csum])
+
+# This function defines storms for every minimum dry gap from 1 to max_gap slots in one
+# pass, for testing how sensitive the storms are to the inter-event time. The storms are
+# the storms agg_prec defines at each gap (storm_event, then storm_windows), so at the same
+# settings they are the storms of the Output files. They form a nested hierarchy: a dry gap
+# between two wet runs joins them at every threshold at or above its length, so the storm
+# starts of all thresholds are read off one (gaps x runs) comparison of the dry gap lengths
+# instead of segmenting the runs again for every gap. storm_event's rules are kept per
+# threshold (the last storm keeps only the final wet run, storms not longer than storm_len
+# are dropped). Whether a storm start joins the storm before it depends only on the gap
+# window before it, so it is tested once per run for all thresholds, and the sums over each
+# storm window come from prefix sums.
+    # Inputs: df = dataframe with startDateTime, the precip column and the columns to sum,
+    # prep = name of the precip column that defines wet runs, cols = list of columns to sum
+    # over each storm, gap_cols = precip and TF columns tested in the gap window before each
+    # storm (see storm_windows), max_gap = largest minimum dry gap (in 30 min increments),
+    # storm_len = storms must be longer than this (in 30 min increments), gap = see agg_prec
+    # Output: dataframe with one row per storm per gap: storm_gap, startDateTime, duration
+    # (minutes) and the sum of each column in cols over the storm window
+def storm_sensitivity(df, prep, cols, gap_cols, max_gap=48, storm_len=0, gap=STORM_PARAMS['gap']):
+    runs = zero_runs(np.nan_to_num(df[prep].to_numpy(dtype=float)))
+    columns = ['storm_gap', 'startDateTime', 'duration'] + cols
+    if len(runs) == 0:
+        return pd.DataFrame(columns=columns)
+    n = len(runs)
+    gaps = np.arange(1, max_gap + 1)
+    index = np.arange(n)
+
+    # storm_event groups: a run starts a group where the dry gap before it is longer than
+    # the threshold. Each group ends at the run before the next group start.
+    group_start = np.hstack([np.ones((len(gaps), 1), dtype=bool),
+                             (runs[1:, 0] - runs[:-1, 1])[None, :] > gaps[:, None]])
+    following = np.where(np.hstack([group_start[:, 1:], np.ones((len(gaps), 1), dtype=bool)]), index + 1, n)
+    group_end = np.minimum.accumulate(following[:, ::-1], axis=1)[:, ::-1] - 1
+    # the last group is replaced by the final wet run, and storms not longer than
+    # storm_len are dropped
+    last_start = np.where(group_start, index, -1).max(axis=1)
+    storm = group_start & (index[None, :] != last_start[:, None])
+    storm[:, -1] = True
+    group_end[:, -1] = n - 1
+    storm &= runs[group_end, 1] - runs[index, 0][None, :] > storm_len
+
+    # a storm joins the storm before it when its gap window holds precip or TF
+    gap_csum = prefix_sums(df, gap_cols)
+    k = runs[:, 0]
+    m = np.maximum(k - gap, 0)
+    wet_gap = ((gap_csum[np.maximum(k - 1, m)] - gap_csum[m]) > 0).any(axis=1)
+    first_storm = np.cumsum(storm, axis=1) == 1
+    joined_start = storm & (~wet_gap[None, :] | first_storm)
+
+    # each joined storm runs from its first storm start to the end of its last storm, and
+    # its window to the next joined start of the same gap, or its end for the last one
+    gap_index, storm_run = np.nonzero(storm)
+    is_start = joined_start[gap_index, storm_run]
+    bounds = np.flatnonzero(is_start)
+    storm_gaps = gap_index[bounds]
+    starts = runs[storm_run[bounds], 0]
+    storm_ends = np.maximum.reduceat(runs[group_end[gap_index, storm_run], 1], bounds)
+    last = np.append(storm_gaps[1:] != storm_gaps[:-1], True)
+    ends = np.where(last, storm_ends, np.append(starts[1:], 0))
+
+    csum = prefix_sums(df, cols)
+    times = pd.DatetimeIndex(pd.to_datetime(df['startDateTime'], utc=True))
+    result = pd.DataFrame({'storm_gap': gaps[storm_gaps], 'startDateTime': times[starts],
+                           'duration': np.asarray((times[storm_ends - 1] - times[starts]) / pd.Timedelta(minutes=1))})
+    result[cols] = csum[ends] - csum[starts]
+    return result
 
     # Inputs: df = dataframe with precip and TF data, prec1 = name of column with priPrecip data,
     # prec2 = name of column with SecPrecip data, tf1 through tf 5 = name of columns with tf data,
-    # gap = minimum gap (in 30 min chunks) between storms
-def agg_prec(df, prec1, prec2, tf1, tf2, tf3, tf4, tf5, medTF, gap):
+    # gap = minimum gap (in 30 min chunks) between storms, site = NEON site (for messages),
+    # storm_gap, storm_len = see storm_event
+def agg_prec(df, prec1, prec2, tf1, tf2, tf3, tf4, tf5, medTF, gap, site='', storm_gap=6, storm_len=0):
     df['startDateTime'] = pd.to_datetime(df['startDateTime'])
     if df[prec2].sum() == 0.0:
         print('secPrecip is zero for ', site)
         prep = prec1 #df[prec1].to_numpy() # **defining storms based on PriPrecip measurement only if SecPrecip = 0
     else:
         prep = prec2 #df[prec2].to_numpy()
-    zero_trail = zero_runs(df[prep])
+    # slots with no precip value count as dry
+    zero_trail = zero_runs(np.nan_to_num(df[prep].to_numpy(dtype=float)))
     df_res = pd.DataFrame(columns=['startDateTime', 'duration', 'duration2', 'p1', 'p2', 'tf1', 'tf2', 'tf3', 'tf4', 'tf5', 'medTF', 'tf1post', 'tf2post', 'tf3post', 'tf4post', 'tf5post', 'IL_perc', 'IL_mm'])
-    storms = storm_event(zero_trail, 0, 6)
-    count = 1
-    counter = 0
-    q = 1
-    for i, j in storms:
-        if count < len(storms):
-            k = storms[count, 0]
-        else:
-            k = j
-        m = k - gap
-        if not df[prep][m:k-1].sum() > 0 and not df[tf1][m:k-1].sum() > 0.0 and not df[tf2][m:k-1].sum() > 0 and not df[tf3][m:k-1].sum() > 0 and not df[tf4][m:k-1].sum() > 0 and not df[tf5][m:k-1].sum() > 0:
-            q = 1
-            counter = counter + 1
-
-            # combine storms if there is precip or TF in the gap.
-        else:
-            if count < len(storms):
-                p = storms[count-q, 0]  # set j value for next storm
-                q = q + 1
-            else:
-                p = i
-            if count < (len(storms)):
-                storms[count, 0] = p
-                k = storms[count, 0]
-        count = count + 1
-
-    r = 0
-    for y in range(len(storms)):
-        r = r + 1
-        if r < len(storms):
-            if storms[r - 1, 0] == storms[r, 0]:
-                g = 0
-                g = np.count_nonzero(storms == storms[r - 1, 0])
-                a = r-1
-                b = ((r-1)+g-1)
-                storms = np.delete(storms, obj=slice(a,b), axis=0) # remove lines above last line with same start time
-
-    step = 1
-    for i, j in storms:
-        if step < len(storms):
-            k = storms[step, 0]
-        else:
-            k = j
-        for m in range(k): # define g as row after precip stops in storm
-            if df[prep][m:k].sum() == 0:
-                g = m
-            else:
-                g = k
-
-        prep1 = df[prec1][i:k].sum()
-        prep2 = df[prec2][i:k].sum()
-        prep_storm = df[prep][i:k].sum()
-        thr1 = df[tf1][i:k].sum()
-        thr2 = df[tf2][i:k].sum()
-        thr3 = df[tf3][i:k].sum()
-        thr4 = df[tf4][i:k].sum()
-        thr5 = df[tf5][i:k].sum()
-        med_TF = df[medTF][i:k].sum()
-        thr1post = df[tf1][g:k].sum()
-        thr2post = df[tf2][g:k].sum()
-        thr3post = df[tf3][g:k].sum()
-        thr4post = df[tf4][g:k].sum()
-        thr5post = df[tf5][g:k].sum()
-        # Calculate Interception loss percent and amount
-        if prep_storm == 0:
-            itcp_loss_perc = 0
-            itcp_mm = 0
-        else:
-            itcp_loss_perc = ((prep_storm - med_TF) / prep_storm) * 100
-            itcp_mm = prep_storm - med_TF
-
-        df_res = df_res.append(
-              {'startDateTime': df['startDateTime'][i],
-              'decimaltime': df['startDateTime'][i],
-              'endDateTime' : df['startDateTime'][k-6],
-              'duration': pd.Timedelta(df['startDateTime'][j-1] - df['startDateTime'][i]).seconds / 60.0,
-              'duration2': pd.Timedelta(df['startDateTime'][k-6] - df['startDateTime'][i]).seconds / 60.0,
-              'p1': prep1,
-              'p2': prep2,
-              'tf1': thr1,
-              'tf2': thr2,
-              'tf3': thr3,
-              'tf4': thr4,
-              'tf5': thr5,
-              'medTF': med_TF,
-              'tf1post': thr1post,
-              'tf2post': thr2post,
-              'tf3post': thr3post,
-              'tf4post': thr4post,
-              'tf5post': thr5post, #}, ignore_index=True)
-              'IL_perc': itcp_loss_perc,
-              'IL_mm': itcp_mm}, ignore_index=True)
-        step = step+1
-
-    print('storms_final:', storms)
+    storms = storm_event(zero_trail, storm_len, storm_gap)
+    if len(storms) == 0:
+        debug('storms_final:', storms)
+        return df_res
+
+    # combine storms with precip or TF in the gap window before the next storm, and
+    # find the window of each storm (see storm_windows)
+    storms, ends = storm_windows(storms, prefix_sums(df, [prep, tf1, tf2, tf3, tf4, tf5]), gap)
+    starts = storms[:, 0]
+
+    # define g as row after precip stops in storm. last_wet holds the position of the
+    # last row with precip at or before each row, so g is one lookup per storm.
+    wet = np.nan_to_num(df[prep].to_numpy(dtype=float)) != 0
+    last_wet = np.maximum.accumulate(np.where(wet, np.arange(len(wet)), -1))
+    post = last_wet[ends - 1] + 1
+
+    # Sum every column over all storm windows in one reduceat pass. The windows tile
+    # the record, so the storm starts plus the final end are the reduceat boundaries.
+    # The post windows [g, k) are summed from interleaved boundaries, with empty
+    # windows set to zero. The float32 slot values are summed in float64.
+    sum_cols = [prec1, prec2, prep, tf1, tf2, tf3, tf4, tf5, medTF]
+    values = np.nan_to_num(df[sum_cols].to_numpy().astype('float64'))
+    values = np.vstack([values, np.zeros((1, len(sum_cols)))])
+    sums = np.add.reduceat(values, np.append(starts, ends[-1]), axis=0)[:-1]
+    post_values = values[:, 3:8]
+    post_sums = np.add.reduceat(post_values, np.column_stack([post, ends]).ravel(), axis=0)[::2]
+    post_sums[post == ends] = 0
+    prep1, prep2, prep_storm = sums[:, 0], sums[:, 1], sums[:, 2]
+    med_TF = sums[:, 8]
+
+    # Calculate Interception loss percent and amount
+    with np.errstate(divide='ignore', invalid='ignore'):
+        itcp_loss_perc = np.where(prep_storm == 0, 0, ((prep_storm - med_TF) / prep_storm) * 100)
+    itcp_mm = np.where(prep_storm == 0, 0, prep_storm - med_TF)
+
+    times = pd.DatetimeIndex(df['startDateTime'])
+    end_times = times[np.maximum(ends - 6, 0)]
+    df_res = pd.DataFrame({
+        'startDateTime': times[starts],
+        'duration': np.asarray((times[storms[:, 1] - 1] - times[starts]) / pd.Timedelta(minutes=1)),
+        'duration2': np.asarray((end_times - times[starts]) / pd.Timedelta(minutes=1)),
+        'p1': prep1,
+        'p2': prep2,
+        'tf1': sums[:, 3],
+        'tf2': sums[:, 4],
+        'tf3': sums[:, 5],
+        'tf4': sums[:, 6],
+        'tf5': sums[:, 7],
+        'medTF': med_TF,
+        'tf1post': post_sums[:, 0],
+        'tf2post': post_sums[:, 1],
+        'tf3post': post_sums[:, 2],
+        'tf4post': post_sums[:, 3],
+        'tf5post': post_sums[:, 4],
+        'IL_perc': itcp_loss_perc,
+        'IL_mm': itcp_mm,
+        'decimaltime': times[starts],
+        'endDateTime': end_times})
+
+    debug('storms_final:', storms)
     return df_res
 
+# This function calculates the median TF of each row over the collectors that were working.
+# A collector counts as working if it recorded any throughfall over the whole record, or,
+# with window set, within the same time window as the row. Rows where no collector was
+# working use the median of all collectors.
+    # Inputs: prec_tf_df = dataframe with startDateTime and the TF columns, tf_cols = list of
+    # TF columns, window = length of the availability windows (e.g. '7D', None uses the whole record)
+def median_tf(prec_tf_df, tf_cols, window=None):
+    values = prec_tf_df[tf_cols].to_numpy(dtype=float)
+    wet = np.nan_to_num(values) > 0
+    if window is None:
+        active = np.repeat(wet.any(axis=0)[None, :], len(values), axis=0)
+    else:
+        windows = parse_times(prec_tf_df['startDateTime']).dt.floor(window).to_numpy()
+        active = pd.DataFrame(wet).groupby(windows).transform('any').to_numpy()
+    active[~active.any(axis=1)] = True
+    with warnings.catch_warnings():
+        # rows where every working collector is NaN give NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmedian(np.where(active, values, np.nan), axis=1)
+
+# This function puts the combined precip and TF data of a site on the same dense grid of
+# 30 minute slots over the period both cover, and adds the median TF. Slots missing from
+# either file stay on the grid as NaN.
+    # Inputs: precip_path = path to the combined precip data file, thrfall_path = path to
+    # the combined throughfall file, site = NEON site, tf_window = see median_tf
+def staging_grid(precip_path, thrfall_path, site, tf_window=None):
+    prec_df = read_frame(precip_path)
+    thrfall_df = read_frame(thrfall_path)
+
+    tf_cols = [col for col in thrfall_df.columns if re.fullmatch(r'TF\d+', col)]
+    prec_slots = time_slots(prec_df['startDateTime'])
+    tf_slots = time_slots(thrfall_df['startDateTime'])
+    first = max(prec_slots.min(), tf_slots.min())
+    last = min(prec_slots.max(), tf_slots.max())
+    if first > last:
+        print('Precip and TF data do not overlap for', site)
+        return None
+    grid = merge_grids([slot_grid(prec_df, ['priPrecipBulk', 'secPrecipBulk'], first, last),
+                        slot_grid(thrfall_df, tf_cols, first, last)])
+    print('Missing precip slots for', site, ':', int(grid['missing']['secPrecipBulk'].sum()))
+
+    # Median TF over the collectors that recorded throughfall
+    grid['values']['medTF'] = median_tf(grid_frame([grid]), tf_cols, tf_window).astype(np.float32)
+    grid['missing']['medTF'] = np.isnan(grid['values']['medTF'])
+    return grid
+
+# This function runs storm_sensitivity on the combined precip and TF data of a site, with
+# storms defined from the same precip column and gap window as agg_prec.
+    # Inputs: precip_path, thrfall_path, site, tf_window, cache_folder = see staging,
+    # max_gap, storm_len = see storm_sensitivity, gap = see agg_prec
+def gap_sensitivity(precip_path, thrfall_path, site, max_gap=48, storm_len=0, tf_window=None, cache_folder=None,
+                    gap=STORM_PARAMS['gap']):
+    sources = [precip_path, thrfall_path]
+    grid = None
+    if cache_folder is not None:
+        grid = load_grid(cache_folder, 'staging_' + site, sources, {'tf_window': tf_window})
+    if grid is None:
+        grid = staging_grid(precip_path, thrfall_path, site, tf_window)
+        if grid is None:
+            return None
+    df = grid_frame([grid])
+    prep = 'priPrecipBulk' if np.nansum(df['secPrecipBulk']) == 0.0 else 'secPrecipBulk'
+    tf_cols = [col for col in df.columns if re.fullmatch(r'TF\d+', col)]
+    cols = ['priPrecipBulk', 'secPrecipBulk'] + tf_cols + ['medTF']
+    result = storm_sensitivity(df, prep, cols, [prep] + tf_cols, max_gap, storm_len, gap)
+    result['Site'] = site
+    return result
+
 # This function creates a file with defined storms, associated precip amount, tf amount,
 # storm duration, IL, and vegetation structure data for a site
     # Inputs: precip_path = path to the combined precip data file,
-    # thrfall_path = path to the combined throughfall file, site = NEON site
-def staging(precip_path, thrfall_path, site, output_path):
+    # thrfall_path = path to the combined throughfall file, site = NEON site,
+    # fmt = format of the Output file ('csv' or 'parquet'), incremental = skip the site if
+    # storms were already defined from the same combined precip and TF files with the same
+    # params and tf_window (storms defined with other settings are replaced),
+    # tf_window = length of the windows used to decide which collectors feed medTF (see median_tf),
+    # cache_folder = folder for the memory-mapped cache of the aligned series (None does not cache),
+    # params = storm definition settings (None uses STORM_PARAMS)
+def staging(precip_path, thrfall_path, site, output_path, fmt='csv', incremental=False, tf_window=None,
+            cache_folder=None, params=None):
+    params = STORM_PARAMS if params is None else params
     # biomass_df = pd.read_csv('static/Biomass.csv')
     # lai_df = pd.read_csv('static/LAI-500m-8d-MCD15A2H-006-results.csv')
     # veg_df = pd.read_csv('static/site_veg.csv')
-
-    prec_df = pd.read_csv(precip_path)
-    thrfall_df = pd.read_csv(thrfall_path)
+    settings = dict(params, tf_window=tf_window)
+    same_settings = True
+    if incremental:
+        manifest = load_manifest(output_path, site, {'staging': frame_path(output_path+'Output_'+site, fmt)})
+        same_settings = manifest.get('staging_settings') == settings
+        if same_settings and len(new_files(manifest, 'staging', [precip_path, thrfall_path])) == 0:
+            print('Storms already defined for', site, 'from the current combined files')
+            return
 
     # site_biomass = biomass_df.loc[(biomass_df.Site == site)]
     # site_lai = lai_df.loc[lai_df.Category == site]
     # site_veg = veg_df.loc[veg_df.Site == site]
 
-    prec_tf_df = pd.merge(prec_df, thrfall_df, on="startDateTime")
-
-    # The if statements below calculate a median TF based on non-zero TF columns
-    if (prec_tf_df['TF1'].any() > 0) & (prec_tf_df['TF2'].any() > 0) & (prec_tf_df['TF3'].any() > 0) & (prec_tf_df['TF4'].any() > 0) & \
-            (prec_tf_df['TF5'].any() > 0):
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF2', 'TF3', 'TF4', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() == 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF2', 'TF3', 'TF4']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() == 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF2', 'TF3', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() == 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF2', 'TF4', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() == 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF3', 'TF4', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() == 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF2', 'TF3', 'TF4', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() == 0 & \
-            prec_tf_df['TF5'].any() == 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF2', 'TF3']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() == 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() == 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF2', 'TF4']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() == 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() == 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF3', 'TF4']].median(axis=1)
-    elif prec_tf_df['TF1'].any() == 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() == 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF2', 'TF3', 'TF4']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() == 0 & prec_tf_df['TF4'].any() == 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF2', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() == 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() == 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF3', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() == 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() == 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF2', 'TF3', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() == 0 & prec_tf_df['TF3'].any() == 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF4', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() == 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() == 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF2', 'TF4', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() == 0 & prec_tf_df['TF2'].any() == 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF3', 'TF4', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() == 0 & prec_tf_df['TF2'].any() == 0 & prec_tf_df['TF3'].any() == 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF4', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() == 0 & prec_tf_df['TF2'].any() == 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() == 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF3', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() == 0 & prec_tf_df['TF2'].any() == 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() == 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF3', 'TF4']].median(axis=1)
-    elif prec_tf_df['TF1'].any() == 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() == 0 & prec_tf_df['TF4'].any() == 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF2', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() == 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() == 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() == 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF2', 'TF4']].median(axis=1)
-    elif prec_tf_df['TF1'].any() == 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() == 0 & \
-            prec_tf_df['TF5'].any() == 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF2', 'TF3']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() == 0 & prec_tf_df['TF3'].any() > 0 & prec_tf_df['TF4'].any() == 0 & \
-            prec_tf_df['TF5'].any() == 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF3']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() == 0 & prec_tf_df['TF3'].any() == 0 & prec_tf_df['TF4'].any() == 0 & \
-            prec_tf_df['TF5'].any() > 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF5']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() == 0 & prec_tf_df['TF3'].any() == 0 & prec_tf_df['TF4'].any() > 0 & \
-            prec_tf_df['TF5'].any() == 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF4']].median(axis=1)
-    elif prec_tf_df['TF1'].any() > 0 & prec_tf_df['TF2'].any() > 0 & prec_tf_df['TF3'].any() == 0 & prec_tf_df['TF4'].any() == 0 & \
-            prec_tf_df['TF5'].any() == 0:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF2']].median(axis=1)
-    else:
-        prec_tf_df['medTF'] = prec_tf_df[['TF1', 'TF2', 'TF3', 'TF4', 'TF5']].median(axis=1)
-
-    interception = agg_prec(prec_tf_df, 'priPrecipBulk', 'secPrecipBulk', 'TF1', 'TF2', 'TF3', 'TF4', 'TF5', 'medTF', 12)
+    # Load the aligned precip and TF series from the cache, or build them from the
+    # combined files
+    sources = [precip_path, thrfall_path]
+    grid = None
+    if cache_folder is not None:
+        grid = load_grid(cache_folder, 'staging_' + site, sources, {'tf_window': tf_window})
+    if grid is None:
+        grid = staging_grid(precip_path, thrfall_path, site, tf_window)
+        if grid is None:
+            return
+        if cache_folder is not None:
+            save_grid(grid, cache_folder, 'staging_' + site, sources, {'tf_window': tf_window})
+    prec_tf_df = grid_frame([grid])
+
+    interception = agg_prec(prec_tf_df, 'priPrecipBulk', 'secPrecipBulk', 'TF1', 'TF2', 'TF3', 'TF4', 'TF5', 'medTF', params['gap'], site,
+                            params['storm_gap'], params['storm_len'])
     interception['Site'] = site
+    count(storms=len(interception))
 
     if len(interception) != 0:
         interception["Date"] = interception["startDateTime"].dt.date
@@ -446,43 +492,47 @@ def staging(precip_path, thrfall_path, site, output_path):
             ["Date", "startDateTime", "duration", "p1", "p2", 'tf1', "tf2", 'tf3', 'tf4', 'tf5', 'medTF', 'tf1post', 'tf2post', 'tf3post', 'tf4post', 'tf5post', "IL_perc", "IL_mm", "Site"]] #"EF", "GH", "SH", "DF", "MF", "PH", "WW", "Lai_500m", "MCH", "Biomass",
         # Reformat column names to match those used by stormselection.py
         interception_loss_df.rename(columns={'p1': 'PriPrecip', 'p2': 'SecPrecip', 'tf1':'TF1', 'tf2':'TF2', 'tf3':'TF3', 'tf4':'TF4','tf5':'TF5'}, inplace=True)
-        path_check = Path(output_path+'Output_'+site+'.csv')
-        if path_check.is_file() == True:
-            h = False
+        # storms defined again from the same period replace the earlier ones, storms
+        # defined with other settings are all replaced
+        if same_settings:
+            append_frame(interception_loss_df, output_path+'Output_'+site, fmt, by_range=True, storms=True)
         else:
-            h = True
+            write_frame(interception_loss_df, output_path+'Output_'+site, fmt)
 
-        interception_loss_df.to_csv(output_path+'Output_'+site+'.csv', mode='a', header = h, index=False)
+    if incremental:
+        mark_ingested(manifest, 'staging', [precip_path, thrfall_path])
+        manifest['staging_settings'] = settings
+        save_manifest(manifest, output_path, site)
 
 
 
 if __name__ == "__main__":
     main_dir = 'C:/Users/Abigail Sandquist/Box/IL/IL_Project/'
 
-    # Define the path to newly downloaded and unzipped NEON data
-    folder_flatten = main_dir+'NEON_Downloads/NEON_precipitation_Jan2023/NEON_precipitation/'
-
-    # Flatten nested files in destination_flatten folder
-    flattened = flatten(folder_flatten)
-
-    # Filter for only 30 min precip and TF files from flattened folder, move to new destination folder
-    source_filter = folder_flatten
+    # Define the path to the downloaded NEON precipitation data. The folder can hold the zip
+    # packages as downloaded, the monthly files are read straight out of them.
     destination_filter = main_dir+'NEON_Downloads/NEON_precip/'
-    filter_string = '30min'
-    sort = filter(source_filter, destination_filter, filter_string)
 
     # Define Sites on which to combine files and define storms
     Sites = ['BART']
 
+    # Format of the intermediate files: 'csv', or 'parquet' for typed columnar files
+    fmt = 'csv'
+    # Only read monthly files (and combined files) that were not processed in an earlier run
+    incremental = True
+
     Sites2 = ['BLAN', 'SCBI', 'SERC', 'DSNY', 'JERC', 'OSBS', 'STEI', 'TREE', 'UNDE', 'KONZ']#,
     Sites3 = ['UKFS', 'GRSM', 'MLBS', 'ORNL', 'DELA', 'LENO', 'TALL', 'RMNP', 'CLBJ', 'YELL', 'SRER', 'ABBY']#,
     Sites4 = ['WREF', 'SJER', 'SOAP', 'TEAK', 'BONA', 'JORN', 'DEJU']
 
-    # Combine monthly precip files into one file per site
+    # Scan the downloaded files once, reusing the catalog from an earlier run for unchanged zip files
     dir_precip = destination_filter
     output_folder_precip = main_dir+'Combined/Precip/'
+    catalog = load_catalog(dir_precip, output_folder_precip+'catalog.json')
+
+    # Combine monthly precip files into one file per site
     date = 'aug22-jan23'
-    concatP = concatPrecip(Sites, dir_precip, output_folder_precip,date)
+    concatP = concatPrecip(Sites, dir_precip, output_folder_precip,date, fmt, incremental, catalog)
     print('All precip data combined')#selec_
 
     # Combine monthly throughfall files into one file per site
@@ -490,21 +540,23 @@ if __name__ == "__main__":
     output_folder_TFconcat = main_dir+'Combined/TF/Concat/'
     for sensor in range(1, 6):
         sensor_str = str(sensor)
-        concatTF(Sites, dir_TF, output_folder_TFconcat, sensor_str)
+        concatTF(Sites, dir_TF, output_folder_TFconcat, sensor_str, fmt, incremental, catalog)
     print('All TF sensors concatenated.')
     dir_TFcombine = output_folder_TFconcat
     output_folder_TFcombine = main_dir+'Combined/TF/'
     #date='aug22-jan23'
-    combTF = combineTF(Sites, dir_TFcombine, output_folder_TFcombine, date)
+    combTF = combineTF(Sites, dir_TFcombine, output_folder_TFcombine, date, fmt)
     print('All TF data combined')
 
 
     # Define storms from combined data files
     for site in Sites:
         # Read in combined TF and precip files
-        precip_path = glob.glob(output_folder_precip + 'Combined_Allprecip_' + site + date+'.csv')
-        thrfall_path = glob.glob(output_folder_TFcombine+'Combined_allTF_' + site + date+'.csv')
+        precip_path = glob.glob(frame_path(output_folder_precip + 'Combined_Allprecip_' + site + date, fmt))
+        thrfall_path = glob.glob(frame_path(output_folder_TFcombine+'Combined_allTF_' + site + date, fmt))
         output_path_staging = main_dir+'Staging/'
+        # memory-mapped cache of the aligned precip and TF series
+        cache_folder = main_dir+'Cache/'
 
         if len(precip_path) == 0 or len(thrfall_path) == 0:
             if len(precip_path) == 0:
@@ -512,5 +564,6 @@ if __name__ == "__main__":
             if len(thrfall_path) == 0:
                 print("Combined TF file does not exist for", site)
         else:
-            staging(precip_path[0], thrfall_path[0], site, output_path_staging) # ouput csv with new storms
+            staging(precip_path[0], thrfall_path[0], site, output_path_staging, fmt, incremental,
+                    cache_folder=cache_folder) # ouput csv with new storms
 
@@ -0,0 +1,89 @@
+import json
+import time
+import threading
+import contextlib
+import tracemalloc
+## This file includes the instrumentation of the pipeline stages. Each stage (and each
+## site in pipeline.py) runs inside measure(), which records its wall and CPU time, the
+## files, bytes and rows it read, the rows it wrote, the storms it defined or selected and
+## its peak memory, and adds the record to a JSON lines log.
+
+# Settings of the instrumentation, changed with configure(). log_path = JSON lines file the
+# records are added to (None does not write them), memory = trace the peak memory of each
+# record with tracemalloc (slows the stages down), quiet = drop the bulk debug printing of
+# the storm definition
+SETTINGS = {'log_path': None, 'memory': False, 'quiet': False}
+
+# Records of the stages running now, the innermost last. Counts are added to all of them,
+# so a site record holds the totals of its stages.
+ACTIVE = []
+
+# Counts are added from the reader threads of read_neon.
+COUNT_LOCK = threading.Lock()
+
+# Counters every record starts with.
+COUNTERS = ['files', 'bytes', 'rows_in', 'rows_out', 'storms', 'selected']
+
+# This function changes the instrumentation settings (see SETTINGS). Worker processes
+# start with the defaults, so pipeline.py passes the settings on to each of them.
+def configure(log_path=None, memory=False, quiet=False):
+    SETTINGS.update(log_path=log_path, memory=memory, quiet=quiet)
+
+# This function prints debug output of the hot paths, unless quiet is set.
+def debug(*args):
+    if not SETTINGS['quiet']:
+        print(*args)
+
+# This function adds to the counters of the stages running now, e.g. count(storms=12).
+def count(**counts):
+    with COUNT_LOCK:
+        for record in ACTIVE:
+            for name, value in counts.items():
+                record[name] = record.get(name, 0) + int(value)
+
+# This function adds a record to the log file.
+def write_record(record):
+    if SETTINGS['log_path'] is not None:
+        with open(SETTINGS['log_path'], 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+# This function measures the stage run inside it and logs the record. Records can be
+# nested, the peak memory of the outer record includes the inner ones.
+# Inputs: stage = stage name, site = NEON site (None for stages run on a list of sites)
+# Output: the record, which the stage can add fields to
+@contextlib.contextmanager
+def measure(stage, site=None):
+    record = {'stage': stage, 'site': site, 'start': time.strftime('%Y-%m-%dT%H:%M:%S'), 'status': 'ok'}
+    record.update({name: 0 for name in COUNTERS})
+    memory = SETTINGS['memory']
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        # keep the peak of the outer records before the peak is reset for this one
+        for outer in ACTIVE:
+            outer['_peak'] = max(outer.get('_peak', 0), peak)
+        tracemalloc.reset_peak()
+        record['_start'] = current
+        record['_peak'] = current
+    ACTIVE.append(record)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield record
+    except BaseException:
+        record['status'] = 'failed'
+        raise
+    finally:
+        record['wall_s'] = time.perf_counter() - wall
+        record['cpu_s'] = time.process_time() - cpu
+        ACTIVE.remove(record)
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            for outer in ACTIVE:
+                outer['_peak'] = max(outer.get('_peak', 0), peak)
+            record['peak_mb'] = (max(record.pop('_peak'), peak) - record.pop('_start')) / 2**20
+        if started:
+            tracemalloc.stop()
+        write_record(record)
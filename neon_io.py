@@ -0,0 +1,597 @@
+import os
+import io
+import re
+import glob
+import json
+import time
+import hashlib
+import zipfile
+import functools
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from instrument import count
+## This file includes the functions used by get_new_storms.py and stormselection.py to
+## read and write the intermediate files passed between stages (Combined_Allprecip_*,
+## TF<n>_*, Combined_allTF_*, Combined_airTemp_* and Output_*), and to read the monthly
+## NEON data files, either unzipped or straight out of the downloaded zip packages.
+
+# File extension for each intermediate file format. 'parquet' stores typed columns
+# (native timestamps and floats) and needs pyarrow installed.
+FORMATS = {'csv': '.csv', 'parquet': '.parquet'}
+
+# Timestamp format of the NEON data files, also used for timestamps in csv intermediate files.
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Start and end time columns of every NEON 30 minute data file.
+NEON_TIME_COLS = ['startDateTime', 'endDateTime']
+
+# Compact dtypes of the columns of the 30 minute frames, applied when a file is read (see
+# apply_schema). Precip, TF and air temp are float32 (NEON reports them to 2 or 3
+# decimals), the start and end times UTC timestamps and the site code categorical.
+SCHEMA = {'priPrecipBulk': 'float32', 'secPrecipBulk': 'float32', 'TFPrecipBulk': 'float32',
+          'tempSingleMean': 'float32', 'air_temp': 'float32', 'Site': 'category'}
+# Dtypes of the columns named by pattern: the TF collectors (TF1, TF2, ...).
+SCHEMA_PATTERNS = [(re.compile(r'TF\d+'), 'float32')]
+# Compact dtypes of the columns of the storm frames (Output_* and the storm selections):
+# the site code categorical and the filter results uint8, with the filter reasons packed
+# in a uint16 bitmask. The storm totals, IL and air temp stay float64, so they are written
+# as computed.
+STORM_SCHEMA = {'Site': 'category', 'select': 'uint8', 'air_partial': 'uint8', 'reasons': 'uint16'}
+
+# Parser used for the monthly NEON files. The pyarrow parser is multithreaded and parses
+# the ISO timestamps natively, the C parser is used when pyarrow is not installed.
+try:
+    import pyarrow
+    NEON_ENGINE = 'pyarrow'
+except ImportError:
+    NEON_ENGINE = 'c'
+
+# This function returns the path of an intermediate file in the given format.
+# Inputs: path = file path without extension, fmt = 'csv' or 'parquet'
+def frame_path(path, fmt='csv'):
+    return path + FORMATS[fmt]
+
+# This function writes an intermediate dataframe as csv or parquet. Timestamp columns
+# are stored as native timestamps in parquet files.
+# Inputs: df = dataframe, path = file path without extension, fmt = 'csv' or 'parquet',
+# append = add the rows to an existing file instead of replacing it
+def write_frame(df, path, fmt='csv', append=False):
+    file = frame_path(path, fmt)
+    count(rows_out=len(df))
+    exists = os.path.isfile(file)
+    if fmt == 'csv':
+        df.to_csv(file, index=False, header=not (append and exists), mode='a' if append else 'w',
+                  encoding='utf-8-sig', date_format=TIME_FORMAT)
+    else:
+        time_cols = [col for col in df.columns if 'DateTime' in col and df[col].dtype == object]
+        df = df.assign(**{col: pd.to_datetime(df[col]) for col in time_cols})
+        if append and exists:
+            df = pd.concat([pd.read_parquet(file), df], ignore_index=True)
+        df.to_parquet(file, index=False)
+
+# This function reads an intermediate file written by write_frame. The format is taken
+# from the file extension, and the columns get their SCHEMA (or STORM_SCHEMA) dtypes.
+# Inputs: file = path to the csv or parquet file, columns = list of columns to read
+# (None reads all columns), storms = the file holds storms (see apply_schema)
+def read_frame(file, columns=None, storms=False):
+    if file.endswith(FORMATS['parquet']):
+        df = pd.read_parquet(file, columns=columns)
+    else:
+        df = pd.read_csv(file, usecols=columns)
+    count(files=1, bytes=os.path.getsize(file), rows_in=len(df))
+    return apply_schema(df, storms)
+
+# This function reads one monthly NEON file. Only the start and end times and one data
+# column are parsed.
+# Inputs: file = path to the NEON csv file or zip member (see catalog_files),
+# value_col = data column to keep (e.g. 'priPrecipBulk'), time_cols = time columns to keep
+def read_neon_file(file, value_col, time_cols=NEON_TIME_COLS):
+    if ZIP_SEP in file:
+        data = read_member(file)
+        count(files=1, bytes=len(data))
+        file = io.BytesIO(data)
+    else:
+        count(files=1, bytes=os.path.getsize(file))
+    dtype = schema_dtype(value_col) or 'float64'
+    return pd.read_csv(file, usecols=time_cols + [value_col], dtype={value_col: dtype}, engine=NEON_ENGINE)
+
+# This function reads a list of monthly NEON files into one dataframe with the columns
+# startDateTime, endDateTime (UTC timestamps) and value_col. The files are read on a pool
+# of threads.
+# Inputs: files = list of NEON csv files, value_col = data column to keep, threads = number
+# of reader threads (None lets the pool decide), time_cols = time columns to keep (e.g.
+# ['startDateTime'] when the end times are not needed)
+def read_neon(files, value_col, threads=None, time_cols=NEON_TIME_COLS):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        frames = list(pool.map(read_neon_file, files, [value_col] * len(files), [time_cols] * len(files)))
+    df = pd.concat(frames, ignore_index=True)
+    count(rows_in=len(df))
+    for col in time_cols:
+        df[col] = pd.to_datetime(df[col], format=TIME_FORMAT, utc=True).astype('datetime64[ns, UTC]')
+    return df
+
+# Parts of a NEON data file name, e.g.
+# NEON.D01.BART.DP1.00006.001.000.060.030.SECPRE_30min.2022-01.basic.20230101T000000Z.csv
+NEON_FILE = re.compile(r'NEON\.(?P<domain>D\d+)\.(?P<site>\w+)\.(?P<product>DP\d\.\d{5}\.\d{3})\.'
+                       r'(?P<horver>\d{3}\.\d{3})\.\d{3}\.(?P<table>\w+)\.(?P<month>\d{4}-\d{2})\.'
+                       r'(?:basic|expanded)\.(?P<release>\w+)\.csv$')
+
+# Separator between a zip file and the path of a member inside it, e.g.
+# NEON_precipitation.zip!NEON.D01.BART.DP1.00006.001.2022-01.basic.20230101T000000Z.zip!NEON.D01...csv
+ZIP_SEP = '!'
+
+# Number of nested zips kept in memory by nested_zip.
+ZIP_CACHE = 16
+
+# This function returns the contents of a zip nested in a zip file. The last ZIP_CACHE are
+# kept, so the members of one monthly package (and their stat and checksum) are read
+# without taking the package out of the outer zip again for each of them.
+# Inputs: parts = tuple of the zip file path and the nested zip paths, stamp = size and
+# modification time of the zip file (so a changed zip file is read again)
+@functools.lru_cache(maxsize=ZIP_CACHE)
+def nested_zip(parts, stamp):
+    with open_zip(parts[:-1]) as archive:
+        return archive.read(parts[-1])
+
+# This function opens the zip file holding a member, going into nested zips as needed.
+# Inputs: parts = zip file path followed by the path of each nested zip inside it
+def open_zip(parts):
+    if len(parts) == 1:
+        return zipfile.ZipFile(parts[0])
+    return zipfile.ZipFile(io.BytesIO(nested_zip(tuple(parts), tuple(source_stamp(parts[0])))))
+
+# This function returns the contents of a zip member.
+# Inputs: file = zip member path made of the zip file and member paths joined by ZIP_SEP
+def read_member(file):
+    parts = file.split(ZIP_SEP)
+    with open_zip(parts[:-1]) as archive:
+        return archive.read(parts[-1])
+
+# This function returns the size and modification time of a file, or for a zip member of
+# the zip file holding it, which does not need the zip opened.
+def source_stamp(file):
+    stat = os.stat(file.split(ZIP_SEP)[0])
+    return [stat.st_size, stat.st_mtime]
+
+# This function returns the size and modification time of a file or zip member.
+def source_stat(file):
+    if ZIP_SEP not in file:
+        stat = os.stat(file)
+        return stat.st_size, stat.st_mtime
+    parts = file.split(ZIP_SEP)
+    with open_zip(parts[:-1]) as archive:
+        info = archive.getinfo(parts[-1])
+    return info.file_size, time.mktime(info.date_time + (0, 0, -1))
+
+# This function adds the NEON data files in a zip (and in the zips nested in it) to the
+# list of catalog records.
+# Inputs: parts = zip file path followed by the nested zip paths, archive = open zip file,
+# files = list of records to add to
+def scan_zip(parts, archive, files):
+    for member in archive.namelist():
+        match = NEON_FILE.match(os.path.basename(member))
+        if match:
+            files.append(dict(match.groupdict(), file=ZIP_SEP.join(parts + [member])))
+        elif member.endswith('.zip'):
+            with zipfile.ZipFile(io.BytesIO(archive.read(member))) as inner:
+                scan_zip(parts + [member], inner, files)
+
+# This function scans a folder of downloaded NEON files once and returns a catalog of
+# the data files in it. The folder may hold the zip packages as downloaded (including
+# nested per-month zips), unzipped folders, or flat csv files. Each file is recorded by
+# domain, site, product, HOR.VER position, table (e.g. 'PRIPRE_30min'), month and release.
+# Files that are not NEON data files (readme, variables, sensor_positions) are left out.
+# Inputs: folder = path to the folder with the NEON files, previous = catalog from an
+# earlier scan, whose records are reused for zip files that did not change
+def scan_catalog(folder, previous=None):
+    old_zips = previous.get('zips', {}) if previous else {}
+    files = []
+    zips = {}
+    for root, _dirs, names in os.walk(folder):
+        for name in sorted(names):
+            path = os.path.join(root, name).replace(os.sep, '/')
+            match = NEON_FILE.match(name)
+            if match:
+                files.append(dict(match.groupdict(), file=path))
+            elif name.endswith('.zip'):
+                stat = os.stat(path)
+                old = old_zips.get(path)
+                if old is not None and old['size'] == stat.st_size and old['mtime'] == stat.st_mtime:
+                    zips[path] = old
+                else:
+                    zips[path] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'files': []}
+                    with zipfile.ZipFile(path) as archive:
+                        scan_zip([path], archive, zips[path]['files'])
+                files.extend(zips[path]['files'])
+    return index_catalog({'folder': folder, 'zips': zips, 'files': files})
+
+# This function builds the lookup table of a catalog: (site, table) -> {HOR.VER: records
+# sorted by month}. When a month is found in more than one release only the latest
+# release is kept.
+def index_catalog(catalog):
+    latest = {}
+    for record in catalog['files']:
+        key = (record['site'], record['table'], record['horver'], record['month'])
+        if key not in latest or record['release'] > latest[key]['release']:
+            latest[key] = record
+    index = {}
+    for (site, table, horver, month) in sorted(latest):
+        positions = index.setdefault((site, table), {})
+        positions.setdefault(horver, []).append(latest[(site, table, horver, month)])
+    catalog['index'] = index
+    return catalog
+
+# This function returns the catalog records (domain, site, product, horver, table, month,
+# release and file) of the monthly files of one site and table in time order.
+# Inputs: see catalog_files
+def catalog_records(catalog, site, table, horver=None):
+    positions = catalog['index'].get((site, table), {})
+    if horver is not None:
+        return positions.get(horver, [])
+    return [record for pos in sorted(positions) for record in positions[pos]]
+
+# This function returns the monthly files of one site and table in time order. Files
+# inside zip packages are returned as zip member paths (see ZIP_SEP), which read_neon reads.
+# Inputs: catalog = dict from scan_catalog, site = NEON site, table = NEON table name
+# (e.g. 'THRPRE_30min'), horver = sensor position (e.g. '001.000', None returns every position)
+def catalog_files(catalog, site, table, horver=None):
+    return [record['file'] for record in catalog_records(catalog, site, table, horver)]
+
+# This function saves a catalog to a json file so a later run can reuse it.
+def save_catalog(catalog, path):
+    with open(path, 'w') as f:
+        json.dump({'folder': catalog['folder'], 'zips': catalog['zips']}, f, indent=1)
+
+# This function returns the catalog of a download folder. The folder is walked again on
+# every call, but zip files that did not change since the catalog saved by an earlier run
+# are not opened again. The new catalog is saved for the next run.
+# Inputs: folder = path to the folder with the NEON files, path = json file for the saved
+# catalog (None scans every zip file)
+def load_catalog(folder, path=None):
+    previous = None
+    if path is not None and os.path.isfile(path):
+        with open(path) as f:
+            previous = json.load(f)
+        if previous.get('folder') != folder:
+            previous = None
+    catalog = scan_catalog(folder, previous)
+    if path is not None:
+        save_catalog(catalog, path)
+    return catalog
+
+# This function parses a column of start times read from an intermediate file. Files
+# written before the timestamp format was fixed use '2022-01-01 00:00:00+00:00' instead
+# of '2022-01-01T00:00:00Z', and may hold both.
+def parse_times(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    values = values.astype(str).str.replace(' ', 'T', regex=False).str.replace('+00:00', 'Z', regex=False)
+    return pd.to_datetime(values, format=TIME_FORMAT, utc=True)
+
+# This function returns the dtype of a column in SCHEMA, or in STORM_SCHEMA when storms is
+# set (None for columns not in it).
+def schema_dtype(col, storms=False):
+    if storms:
+        return STORM_SCHEMA.get(col)
+    if col in SCHEMA:
+        return SCHEMA[col]
+    for pattern, dtype in SCHEMA_PATTERNS:
+        if pattern.fullmatch(col):
+            return dtype
+    return None
+
+# This function converts the columns of a per-site frame to their SCHEMA dtypes, or their
+# STORM_SCHEMA dtypes when storms is set, and the start and end times (also endDateTime_x
+# and endDateTime_y of the combined precip files) to UTC timestamps. Other columns are left
+# as they are.
+def apply_schema(df, storms=False):
+    for col in df.columns:
+        dtype = schema_dtype(col, storms)
+        if col.split('_')[0] in NEON_TIME_COLS:
+            df[col] = parse_times(df[col])
+        elif dtype is not None and df[col].dtype != dtype:
+            df[col] = df[col].astype(dtype)
+    return df
+
+# Length of one NEON time slot in minutes. Timestamps are stored on a dense grid of slots
+# numbered as minutes since 1970-01-01 UTC divided by SLOT_MINUTES.
+SLOT_MINUTES = 30
+
+# This function returns the slot number of each timestamp.
+# Inputs: values = column of start times (timestamps or text)
+def time_slots(values):
+    times = pd.DatetimeIndex(parse_times(values))
+    if times.tz is not None:
+        times = times.tz_convert(None)
+    minutes = times.to_numpy().astype('datetime64[m]').astype(np.int64)
+    return minutes // SLOT_MINUTES
+
+# This function puts columns of a dataframe on a dense grid of slots from first to last.
+# The grid is a dict with the first slot number, one float array per column ('values')
+# and one bool array per column that is True where the slot has no value ('missing').
+# Slots outside first..last are dropped, and for repeated slots the last row is kept.
+# Inputs: df = dataframe with startDateTime, columns = list of columns to put on the
+# grid, first, last = first and last slot number (None uses the first and last row)
+def slot_grid(df, columns, first=None, last=None):
+    slots = time_slots(df['startDateTime'])
+    first = slots.min() if first is None else first
+    last = slots.max() if last is None else last
+    inside = (slots >= first) & (slots <= last)
+    pos = slots[inside] - first
+    grid = {'first': int(first), 'values': {}, 'missing': {}}
+    for col in columns:
+        # float32 columns stay float32 on the grid
+        dtype = np.result_type(df[col].dtype, np.float32) if df[col].dtype.kind == 'f' else np.float64
+        values = np.full(last - first + 1, np.nan, dtype=dtype)
+        values[pos] = df[col].to_numpy(dtype=dtype)[inside]
+        grid['values'][col] = values
+        grid['missing'][col] = np.isnan(values)
+    return grid
+
+# This function returns the start time of every slot of a grid.
+def grid_times(grid):
+    length = len(next(iter(grid['values'].values())))
+    minutes = (grid['first'] + np.arange(length)) * SLOT_MINUTES
+    return pd.DatetimeIndex(pd.to_datetime(minutes, unit='m', utc=True), name='startDateTime')
+
+# This function returns the min, mean and max of one grid column over time windows, and
+# the share of the slots of each window that have a value. The mean comes from prefix
+# sums, the min and max from one reduceat pass over the (start, end + 1) boundaries of
+# all windows, so the windows can overlap.
+# Inputs: grid = dict from slot_grid, col = column name, starts, ends = columns of the
+# first and last time of each window (both included)
+# Output: dict with arrays min, mean, max (NaN for windows without values) and coverage
+def grid_window(grid, col, starts, ends):
+    column = np.asarray(grid['values'][col]).astype('float64')
+    first = time_slots(starts) - grid['first']
+    last = time_slots(ends) - grid['first']
+    length = np.maximum(last - first + 1, 1)
+    lo = np.clip(first, 0, len(column))
+    hi = np.clip(last + 1, lo, len(column))
+    valid = ~np.isnan(column)
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, column, 0.0))))
+    found = counts[hi] - counts[lo]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(found > 0, (sums[hi] - sums[lo]) / found, np.nan)
+    # fmin and fmax skip NaN, the padding slot keeps every boundary inside the array
+    padded = np.append(column, np.nan)
+    bounds = np.column_stack([lo, hi]).ravel()
+    low = np.fmin.reduceat(padded, bounds)[::2]
+    high = np.fmax.reduceat(padded, bounds)[::2]
+    empty = found == 0
+    low[empty] = np.nan
+    high[empty] = np.nan
+    return {'min': low, 'mean': mean, 'max': high, 'coverage': found / length}
+
+# This function joins grids that cover the same slots into one dataframe with a
+# startDateTime column and one column per grid column.
+def grid_frame(grids):
+    df = pd.DataFrame({'startDateTime': grid_times(grids[0])})
+    for grid in grids:
+        for col, values in grid['values'].items():
+            df[col] = values
+    return df
+
+# This function joins grids that cover the same slots into one grid.
+def merge_grids(grids):
+    merged = {'first': grids[0]['first'], 'values': {}, 'missing': {}}
+    for grid in grids:
+        merged['values'].update(grid['values'])
+        merged['missing'].update(grid['missing'])
+    return merged
+
+# This function saves a grid as a folder of NumPy files, one per column and missing mask,
+# with a json header holding the time origin, step, first slot, columns, and the size and
+# modification time of the files the grid was built from.
+# Inputs: grid = dict from slot_grid, folder = cache folder, name = name of the grid
+# (e.g. 'staging_BART'), sources = files the grid was built from, params = settings the
+# grid depends on (dict of json values)
+def save_grid(grid, folder, name, sources=(), params=None):
+    path = folder + name + '/'
+    os.makedirs(path, exist_ok=True)
+    header_file = path + 'header.json'
+    # drop the old header first, so a half written cache is never loaded
+    if os.path.isfile(header_file):
+        os.remove(header_file)
+    for col, values in grid['values'].items():
+        np.save(path + col + '.npy', np.asarray(values))
+        np.save(path + col + '.missing.npy', np.asarray(grid['missing'][col]))
+    header = {'origin': '1970-01-01T00:00:00Z', 'step': SLOT_MINUTES, 'first': grid['first'],
+              'length': len(next(iter(grid['values'].values()))), 'columns': list(grid['values']),
+              'sources': {file: list(source_stat(file)) for file in sources}, 'params': params or {}}
+    with open(header_file, 'w') as f:
+        json.dump(header, f, indent=1)
+
+# This function loads a grid saved by save_grid with the column arrays memory-mapped, so
+# nothing is read until it is used. None is returned if there is no saved grid, or if
+# the source files or settings changed since it was saved.
+# Inputs: folder = cache folder, name = name of the grid, sources = files the grid is
+# built from, params = settings the grid depends on
+def load_grid(folder, name, sources=(), params=None):
+    path = folder + name + '/'
+    if not os.path.isfile(path + 'header.json'):
+        return None
+    with open(path + 'header.json') as f:
+        header = json.load(f)
+    if header['step'] != SLOT_MINUTES or header['params'] != (params or {}):
+        return None
+    for file in sources:
+        if header['sources'].get(file) != list(source_stat(file)):
+            return None
+    grid = {'first': header['first'], 'values': {}, 'missing': {}}
+    for col in header['columns']:
+        grid['values'][col] = np.load(path + col + '.npy', mmap_mode='r')
+        grid['missing'][col] = np.load(path + col + '.missing.npy', mmap_mode='r')
+    return grid
+
+# This function adds rows to an intermediate file. Rows already in the file with the
+# same key (start time) are replaced, so re-running a stage on the same data does not
+# duplicate rows. When all new rows come after the rows in the file they are simply
+# appended, otherwise the file is rewritten in time order.
+# Inputs: df = dataframe, path = file path without extension, fmt = 'csv' or 'parquet',
+# key = column that identifies a row, by_range = replace every row whose key falls
+# between the first and last key of df (used for storms, whose start times can move
+# when they are defined again), storms = the file holds storms (see apply_schema)
+def append_frame(df, path, fmt='csv', key='startDateTime', by_range=False, storms=False):
+    file = frame_path(path, fmt)
+    if len(df) == 0:
+        return
+    if not os.path.isfile(file):
+        write_frame(df, path, fmt)
+        return
+    old_keys = parse_times(read_frame(file, columns=[key])[key])
+    new_keys = parse_times(df[key])
+    if by_range:
+        replaced = ((old_keys >= new_keys.min()) & (old_keys <= new_keys.max())).to_numpy()
+    else:
+        replaced = old_keys.isin(new_keys).to_numpy()
+    if not replaced.any() and (len(old_keys) == 0 or new_keys.min() > old_keys.max()):
+        write_frame(df, path, fmt, append=True)
+    else:
+        old = read_frame(file, storms=storms)[~replaced]
+        combined = pd.concat([old, df], ignore_index=True)
+        order = parse_times(combined[key]).argsort(kind='stable')
+        write_frame(combined.iloc[order], path, fmt)
+
+# This function returns the md5 checksum of a file or zip member.
+def checksum(file):
+    md5 = hashlib.md5()
+    if ZIP_SEP in file:
+        md5.update(read_member(file))
+        return md5.hexdigest()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+# This function returns the size, modification time and checksum of a file or zip member.
+# The record of a zip member also holds the stamp of its zip file (see source_stamp).
+def file_record(file):
+    size, mtime = source_stat(file)
+    record = {'size': size, 'mtime': mtime, 'md5': checksum(file)}
+    if ZIP_SEP in file:
+        record['zip'] = source_stamp(file)
+    return record
+
+# This function returns True if a zip member is in a zip file that did not change since
+# its record was made, so the member did not change either and the zip is not opened.
+def zip_unchanged(file, record):
+    return ZIP_SEP in file and record.get('zip') == source_stamp(file)
+
+# This function loads the manifest of files already ingested for a site. Each stage
+# keeps one manifest per site in its output folder, so sites can run in parallel.
+# The manifest maps a product (e.g. 'PRIPRE') to {file name: file record}.
+# outputs = dict of product -> file the product is ingested into. Products whose file does
+# not exist are dropped, so a deleted file is built again from all files.
+def load_manifest(output_folder, site, outputs=None):
+    path = output_folder + 'manifest_' + site + '.json'
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        manifest = json.load(f)
+    for product, file in (outputs or {}).items():
+        if not os.path.isfile(file):
+            manifest.pop(product, None)
+    return manifest
+
+# This function saves the manifest of ingested files for a site.
+def save_manifest(manifest, output_folder, site):
+    with open(output_folder + 'manifest_' + site + '.json', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+# This function returns the files of one product that are not in the manifest yet or
+# whose contents changed since they were ingested. Files with the same size and
+# modification time, and zip members of a zip file that did not change, are skipped
+# without reading them.
+# Inputs: manifest = dict from load_manifest, product = product name, files = list of files
+def new_files(manifest, product, files):
+    done = manifest.get(product, {})
+    delta = []
+    for file in files:
+        record = done.get(os.path.basename(file))
+        if record is not None and zip_unchanged(file, record):
+            continue
+        size, mtime = source_stat(file)
+        if record is not None and record['size'] == size:
+            if record['mtime'] == mtime or record['md5'] == checksum(file):
+                record['mtime'] = mtime
+                if ZIP_SEP in file:
+                    record['zip'] = source_stamp(file)
+                continue
+        delta.append(file)
+    return delta
+
+# This function records files of one product as ingested in the manifest.
+def mark_ingested(manifest, product, files):
+    done = manifest.setdefault(product, {})
+    for file in files:
+        done[os.path.basename(file)] = file_record(file)
+
+# This function returns the size, modification time and checksum of each file. The record
+# of a file whose size and modification time did not change, or of a zip member whose zip
+# file did not change, is taken from previous, so unchanged files are not read again.
+# Inputs: files = list of files or zip members, previous = dict of file -> record from an
+# earlier call (None reads every file)
+def file_hashes(files, previous=None):
+    previous = previous or {}
+    records = {}
+    for file in files:
+        record = previous.get(file)
+        if record is not None and zip_unchanged(file, record):
+            records[file] = record
+            continue
+        size, mtime = source_stat(file)
+        if record is None or record['size'] != size or record['mtime'] != mtime:
+            record = file_record(file)
+        elif ZIP_SEP in file:
+            record = dict(record, zip=source_stamp(file))
+        records[file] = record
+    return records
+
+# This function returns the cache key of a stage run: a hash of the stage name, its
+# settings and the names and checksums of its input files.
+def stage_key(stage, params, inputs):
+    contents = sorted([os.path.basename(file), record['md5']] for file, record in inputs.items())
+    text = json.dumps({'stage': stage, 'params': params, 'inputs': contents}, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+# This function runs one stage for one site, unless it already ran on inputs with the same
+# contents and with the same settings, and its outputs were not changed or removed since.
+# A stamp with the cache key and the input and output records of every run is kept in the
+# stages folder of cache_folder. A stage that rewrites an output with the same contents
+# does not make the stages reading it run again, since the key is built from checksums.
+# Inputs: cache_folder = cache folder, stage = stage name, site = NEON site, inputs = files
+# the stage reads, outputs = files the stage writes, params = settings the outputs depend
+# on (must convert to JSON), run = function that runs the stage
+# Output: True if the stage ran, False if it was skipped
+def cached_stage(cache_folder, stage, site, inputs, outputs, params, run):
+    path = cache_folder + 'stages/' + stage + '_' + site + '.json'
+    stamp = {}
+    if os.path.isfile(path):
+        with open(path) as f:
+            stamp = json.load(f)
+    records = file_hashes(inputs, stamp.get('inputs'))
+    key = stage_key(stage, params, records)
+    if stamp.get('key') == key and all(os.path.isfile(file) and list(source_stat(file)) == record
+                                       for file, record in stamp['outputs'].items()):
+        return False
+    # drop the stamp first, so a failed run is never taken as done
+    if os.path.isfile(path):
+        os.remove(path)
+    run()
+    stamp = {'key': key, 'params': params, 'inputs': records,
+             'outputs': {file: list(source_stat(file)) for file in outputs if os.path.isfile(file)}}
+    os.makedirs(cache_folder + 'stages/', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(stamp, f, indent=1)
+    return True
+
+# This function writes a csv copy next to every parquet intermediate file in a folder,
+# for runs that use parquet but still need csv files to share.
+# Inputs: folder = path to the folder with parquet files
+def export_csv(folder):
+    for file in glob.glob(folder + '*' + FORMATS['parquet']):
+        pd.read_parquet(file).to_csv(file[:-len(FORMATS['parquet'])] + FORMATS['csv'], index=False,
+                                     encoding='utf-8-sig')
@@ -0,0 +1,196 @@
+import os
+import traceback
+import concurrent.futures
+import pandas as pd
+import neon_io
+import get_new_storms
+import stormselection
+from neon_io import frame_path, checksum, source_stamp, load_catalog, catalog_files, cached_stage
+from instrument import SETTINGS, configure, measure
+## This program runs the get_new_storms.py and stormselection.py stages for a list of
+## sites in parallel. Sites share no state, so each site runs the whole pipeline in its
+## own worker process and one bad site does not stop the rest of the batch.
+
+# This function returns the folder layout used by the get_new_storms.py and
+# stormselection.py drivers, relative to one main directory.
+def site_paths(main_dir):
+    return {'precip_raw': main_dir+'NEON_Downloads/NEON_precip/',
+            'precip': main_dir+'Combined/Precip/',
+            'tf_concat': main_dir+'Combined/TF/Concat/',
+            'tf': main_dir+'Combined/TF/',
+            'staging': main_dir+'Staging/',
+            'air_raw': main_dir+'NEON_Downloads/NEON_Temp/',
+            'air': main_dir+'Combined/Temp/',
+            'selected': main_dir+'Selected_Storms/',
+            'cache': main_dir+'Cache/'}
+
+# This function returns a checksum of the code of a stage module and neon_io.py, so the
+# stage cache is not used after the code of a stage changed.
+def code_version(module):
+    return checksum(os.path.abspath(neon_io.__file__)) + checksum(os.path.abspath(module.__file__))
+
+# This function runs every stage for one site: concatPrecip, concatTF, combineTF,
+# staging, combine_air and storm_select. Errors are caught and returned so they
+# can be reported per site. Each stage, and the site as a whole, is measured and logged
+# by instrument.measure. A stage is skipped when its input files, its settings and the
+# code are the same as in the run that wrote its outputs (see neon_io.cached_stage), so
+# changing a filter setting only runs storm_select again.
+# Inputs: site = NEON site, paths = dict of folders (see site_paths), date = date tag
+# used in the combined precip and TF file names, fmt = format of the intermediate files
+# ('csv' or 'parquet'), incremental = only process monthly files not ingested in an
+# earlier run, catalogs = (precip catalog, air temp catalog) of the download folders from
+# load_catalog (None scans the folders for this site), settings = instrumentation settings
+# (see instrument.configure, None keeps the settings of this process), cache = skip the
+# stages whose inputs and settings did not change, air_by_storm = read the air temp of the
+# storm windows straight from the monthly files instead of running combine_air
+def process_site(site, paths, date, fmt='csv', incremental=False, catalogs=(None, None), settings=None, cache=True,
+                 air_by_storm=False):
+    if settings is not None:
+        configure(**settings)
+    result = {'site': site, 'status': 'ok', 'storms': 0, 'selected': 0, 'error': ''}
+    code = {module: code_version(module) for module in [get_new_storms, stormselection]}
+
+    # runs one stage of a module through the stage cache and notes in the stage record
+    # whether it ran
+    def run_stage(record, module, stage, inputs, outputs, params, run):
+        params = dict(params, fmt=fmt, code=code[module])
+        if cache:
+            record['cached'] = not cached_stage(paths['cache'], stage, site, inputs, outputs, params, run)
+        else:
+            run()
+
+    try:
+        with measure('site', site):
+            precip_catalog, air_catalog = catalogs
+            if precip_catalog is None:
+                precip_catalog = load_catalog(paths['precip_raw'])
+            if air_catalog is None:
+                air_catalog = load_catalog(paths['air_raw'])
+            precip_path = frame_path(paths['precip']+'Combined_Allprecip_'+site+date, fmt)
+            tf_paths = [frame_path(paths['tf_concat']+'TF'+str(sensor)+'_'+site, fmt) for sensor in range(1, 6)]
+            thrfall_path = frame_path(paths['tf']+'Combined_allTF_'+site+date, fmt)
+            output_path = frame_path(paths['staging']+'Output_'+site, fmt)
+            air_path = frame_path(paths['air']+'Combined_airTemp_'+site, fmt)
+            selected_paths = [paths['selected']+'all_storms_'+site+'_filter_index.csv',
+                              paths['selected']+'Selected_storms_'+site+'.csv']
+
+            with measure('concatPrecip', site) as record:
+                run_stage(record, get_new_storms, 'concatPrecip',
+                          catalog_files(precip_catalog, site, 'PRIPRE_30min')
+                          + catalog_files(precip_catalog, site, 'SECPRE_30min'), [precip_path], {},
+                          lambda: get_new_storms.concatPrecip([site], paths['precip_raw'], paths['precip'], date, fmt,
+                                                              incremental, precip_catalog))
+            with measure('concatTF', site) as record:
+                for sensor in range(1, 6):
+                    run_stage(record, get_new_storms, 'concatTF'+str(sensor),
+                              catalog_files(precip_catalog, site, 'THRPRE_30min', '00'+str(sensor)+'.000'),
+                              [tf_paths[sensor - 1]], {},
+                              lambda: get_new_storms.concatTF([site], paths['precip_raw'], paths['tf_concat'],
+                                                              str(sensor), fmt, incremental, precip_catalog))
+            with measure('combineTF', site) as record:
+                run_stage(record, get_new_storms, 'combineTF', [file for file in tf_paths if os.path.isfile(file)],
+                          [thrfall_path], {},
+                          lambda: get_new_storms.combineTF([site], paths['tf_concat'], paths['tf'], date, fmt))
+
+            if not os.path.isfile(precip_path) or not os.path.isfile(thrfall_path):
+                result['status'] = 'skipped'
+                result['error'] = 'Combined precip or TF file does not exist'
+                return result
+            # staging runs without its own incremental skip, which would keep the stale storms
+            # whenever the stage cache finds the settings or the code changed
+            with measure('staging', site) as record:
+                run_stage(record, get_new_storms, 'staging', [precip_path, thrfall_path], [output_path],
+                          dict(get_new_storms.STORM_PARAMS, tf_window=None),
+                          lambda: get_new_storms.staging(precip_path, thrfall_path, site, paths['staging'], fmt,
+                                                         False, cache_folder=paths['cache']))
+
+            air_files = catalog_files(air_catalog, site, 'SAAT_30min', '000.020')
+            if air_by_storm:
+                # the monthly air temp files are keyed on the size and modification time of
+                # the file or zip file holding them, so the months without storms are never read
+                with measure('storm_select', site) as record:
+                    run_stage(record, stormselection, 'storm_select', [output_path], selected_paths,
+                              dict(stormselection.FILTER_FLAGS, **stormselection.FILTER_PARAMS,
+                                   air=[[os.path.basename(file)] + source_stamp(file) for file in air_files]),
+                              lambda: stormselection.storm_select([site], paths['air'], paths['staging'],
+                                                                  paths['selected'], fmt, air_catalog=air_catalog))
+            else:
+                with measure('combine_air', site) as record:
+                    run_stage(record, stormselection, 'combine_air', air_files, [air_path], {},
+                              lambda: stormselection.combine_air([site], paths['air_raw'], paths['air'], fmt,
+                                                                 incremental, air_catalog))
+                with measure('storm_select', site) as record:
+                    run_stage(record, stormselection, 'storm_select', [output_path, air_path], selected_paths,
+                              dict(stormselection.FILTER_FLAGS, **stormselection.FILTER_PARAMS),
+                              lambda: stormselection.storm_select([site], paths['air'], paths['staging'],
+                                                                  paths['selected'], fmt, paths['cache']))
+            result['storms'] = len(pd.read_csv(selected_paths[0], usecols=['select']))
+            result['selected'] = len(pd.read_csv(selected_paths[1], usecols=['select']))
+    except Exception:
+        result['status'] = 'failed'
+        result['error'] = traceback.format_exc()
+    return result
+
+# This function fans the per-site work out to a pool of worker processes. The download
+# folders are scanned once here and the catalogs are shared by every site. Results are
+# returned in the same order as Sites, whatever order the sites finish in.
+# Inputs: Sites = list of sites, paths = dict of folders (see site_paths), date = date
+# tag for the combined files, workers = number of worker processes (None uses one per
+# CPU, 1 runs the sites one after another in this process), fmt = format of the
+# intermediate files ('csv' or 'parquet'), incremental = only process monthly files not
+# ingested in an earlier run, cache = skip the stages whose inputs and settings did not
+# change since the last run, air_by_storm = read only the air temp of the storm windows
+# from the monthly files (see process_site). The instrumentation settings of this process
+# (see instrument.configure) are passed on to the workers.
+def run_sites(Sites, paths, date, workers=None, fmt='csv', incremental=False, cache=True, air_by_storm=False):
+    with measure('catalog'):
+        catalogs = (load_catalog(paths['precip_raw'], paths['precip']+'catalog.json'),
+                    load_catalog(paths['air_raw'], paths['air']+'catalog.json'))
+    settings = dict(SETTINGS)
+    if workers is None:
+        workers = min(len(Sites), os.cpu_count() or 1)
+    if workers <= 1:
+        return [process_site(site, paths, date, fmt, incremental, catalogs, None, cache, air_by_storm)
+                for site in Sites]
+
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(process_site, site, paths, date, fmt, incremental, catalogs, settings, cache,
+                               air_by_storm) for site in Sites]
+        for site, future in zip(Sites, futures):
+            try:
+                results.append(future.result())
+            except Exception as err:
+                # the worker itself died (e.g. out of memory)
+                results.append({'site': site, 'status': 'failed', 'storms': 0, 'selected': 0, 'error': repr(err)})
+    return results
+
+# This function prints one line per site with the outcome of run_sites.
+def print_summary(results):
+    for result in results:
+        if result['status'] == 'ok':
+            print(result['site'], 'ok:', result['storms'], 'storms,', result['selected'], 'selected')
+        else:
+            print(result['site'], result['status']+':', result['error'])
+
+
+if __name__ == "__main__":
+    main_dir = 'C:/Users/Abigail Sandquist/Box/IL/IL_Project/'
+    paths = site_paths(main_dir)
+
+    Sites = ['ABBY', 'BART', 'BLAN', 'DEJU', 'DELA', 'DSNY', 'GRSM', 'GUAN', 'JERC', 'KONZ', 'LENO', 'MLBS',
+             'ORNL', 'OSBS', 'SERC', 'STEI', 'TEAK', 'TREE', 'UKFS', 'UNDE', 'WREF', 'YELL']
+    date = 'jan23'
+    # Number of worker processes. None uses one per CPU, 1 runs the sites serially.
+    workers = None
+    # Format of the intermediate files: 'csv', or 'parquet' for typed columnar files
+    fmt = 'csv'
+    # Only process monthly files that were not ingested in an earlier run
+    incremental = True
+    # Add a record with the time, rows, files and storms of every stage and site to
+    # pipeline_log.jsonl, set memory to also record the peak memory (slower), and quiet to
+    # drop the debug printing of the storm definition
+    configure(log_path=main_dir+'pipeline_log.jsonl', memory=False, quiet=True)
+
+    results = run_sites(Sites, paths, date, workers, fmt, incremental)
+    print_summary(results)
@@ -1,1487 +1,369 @@
-import os
-import glob
+import re
+import warnings
+import itertools
+import numpy as np
 import pandas as pd
-import shutil
-import math
 import matplotlib.pyplot as plt
 from pathlib import Path
-
-# This function flattens the file structure of the downloaded files from NEON.
-def flatten(destination):
-    all_files = []
-    first_loop_pass = True
-    for root, _dirs, files in os.walk(destination):
-        if first_loop_pass:
-            first_loop_pass = False
-            continue
-        for filename in files:
-            if not 'readme' in filename and not 'JERC' in filename:
-                all_files.append(os.path.join(root, filename))
-    for filename in all_files:
-        shutil.move(filename, destination)
-    print("Files flattened")
-
-# This function filters for only the files you want to read from the downloaded package.
-def filter(source, destination, filter_string):
-    files = os.listdir(source)
-    for file in files:
-        if filter_string in file:
-            file_name = os.path.join(source, file)
-            shutil.move(file_name, destination)
-    print("Files filtered")
+from instrument import count
+from neon_io import apply_schema, frame_path, read_frame, read_neon, time_slots, slot_grid, grid_window, save_grid, load_grid, load_catalog, catalog_records, catalog_files, append_frame, load_manifest, save_manifest, new_files, mark_ingested
+
+# Set the following variables to 1 if you want the filter turned on,
+# or to zero if you want the associated filter turned off.
+FILTER_FLAGS = {
+    'a': 1, # Removes storms with suspected snow. Set temp_thresh variable for the limit)
+    'b': 1, # Removes storms where not all TF collectors are working in the next storm.
+    'c': 1, # Removes storms where not all TF collectors are working.
+    'd': 0, # Removes storms if a TF collector has large difference from average of other TF collectors. See perc_thresh variable
+    'e': 1, # Removes storms where more than 1 TF collector exceeds % of SecPrecip, see highest variable
+    'f': 0, # Removes storms that have too wide range in TF values. Similar to d, but calculated based on percent IL for each TF collector. See diff_thresh and small, med, and large variables.
+    'g': 0, # Removes storms that have too wide range of TF values (continuous function with storm size, see metric variable).
+    'h': 1, # Removes storms if there is a large difference between TF collectors (controlled by storm size and logaritmic decay function. See variables A, B, and C)
+    'p': 1, # Removes storms in which not all TF collectors were working in the previous storm.
+    'q': 1, # Removes storms with more than 2 zero TF readings
+}
+
+FILTER_PARAMS = {
+    # Variables A and B are used to calculate logarithmic decay function to define threshold for percent difference in TF
+    # for filter h. diff_thresh = A*e^(-B*storm size)+C
+    'A': 1000,
+    'B': 0.25,
+    'C': 68,
+
+    # The parameters below affect the filtering functions. They can be adjusted as desired.
+    'highest': 1.05,
+    'excess': 2,
+    'metric': 120,
+    'small': 300,
+    'med': 200,
+    'large': 100,
+
+    # set threshholds for evaluating storms
+    'temp_thresh': 0.0, #degrees Celcius, compared with the lowest air temp during the storm
+    'perc_thresh': .5,
+}
+
+# Bit of each filter in the 'reasons' column of the storms. Filters f and g share one bit
+# since they are the same check with a different threshold.
+FILTER_BITS = {'a': 1, 'b': 2, 'c': 4, 'd': 8, 'e': 16, 'fg': 32, 'h': 64, 'p': 128, 'q': 256}
 
 #This function combines all air temp monthly data into one file per site
 # Inputs: Sites = list of sites to run the function on, path = path to the folder where
 # the monthly air temp data is located, output_folder = path to the folder where you want
-# the output combined Air temp file per site to be stored.
-def combine_air(Sites, path, output_folder):
+# the output combined Air temp file per site to be stored, fmt = format of the combined
+# file ('csv' or 'parquet'), incremental = only read monthly files not ingested in an
+# earlier run. Rows for months already in the combined file are replaced, not duplicated.
+# catalog = catalog of path from load_catalog (None scans path once for all sites)
+def combine_air(Sites, path, output_folder, fmt='csv', incremental=False, catalog=None):
+    if catalog is None:
+        catalog = load_catalog(path)
     for site in Sites:
         combinedA_df = pd.DataFrame()
-        all_filenames_air = [i for i in glob.glob(path + 'NEON.D*.'+site+'.*.020.030.SAAT_30min.*.csv')]
+        all_filenames_air = catalog_files(catalog, site, 'SAAT_30min', '000.020')
+        if incremental:
+            manifest = load_manifest(output_folder, site, {'SAAT': frame_path(output_folder+'Combined_airTemp_'+site, fmt)})
+            ingested = len(manifest.get('SAAT', {}))
+            all_filenames_air = new_files(manifest, 'SAAT', all_filenames_air)
+            if len(all_filenames_air) == 0 and ingested > 0:
+                print('No new air temp files for', site)
+                continue
         if (len(all_filenames_air) == 0):
             print('No air temp files for', site)
         else:
             #combine all files in the list
-            combined_csv_air = pd.concat([pd.read_csv(f) for f in all_filenames_air])
+            combined_csv_air = read_neon(all_filenames_air, 'tempSingleMean')
             #export to csv
             combinedA_df['startDateTime'] = combined_csv_air['startDateTime']
             combinedA_df['endDateTime'] = combined_csv_air['endDateTime']
             combinedA_df['air_temp'] = combined_csv_air['tempSingleMean']
 
-        path_check = Path(output_folder+'Combined_airTemp_'+site+'.csv')
-        if path_check.is_file() == True:
-            ha = False
-        else:
-            ha = True
-        #ha = True
-        print('header for combined air temp file', ha)
-        combinedA_df.to_csv(output_folder+'Combined_airTemp_'+site+'.csv', index=False, header = ha, mode='a', encoding='utf-8-sig')
+        append_frame(combinedA_df, output_folder+'Combined_airTemp_'+site, fmt)
+        if incremental:
+            mark_ingested(manifest, 'SAAT', all_filenames_air)
+            save_manifest(manifest, output_folder, site)
     print('All air temp files combined.')
 
+# This function returns the TF collector columns (TF1, TF2, ...) of a storm dataframe,
+# so the filters work for any number of collectors.
+def tf_columns(storms):
+    cols = [col for col in storms.columns if re.fullmatch(r'TF\d+', col)]
+    return sorted(cols, key=lambda col: int(col[2:]))
+
+# This function builds the (storms x collectors x collectors) percent difference between
+# every pair of TF collectors and reduces it to the largest difference per storm. Zero
+# (inactive) or missing collectors are masked out; storms with fewer than two usable
+# collectors get -inf so they never exceed a threshold.
+# Inputs: values = 2D array (storms x collectors) of TF or IL amounts,
+# active = 2D boolean array marking the collectors in use for each storm.
+def max_pair_diff(values, active):
+    n, k = values.shape
+    if k < 2:
+        return np.full(n, -np.inf)
+    usable = active & ~np.isnan(values)
+    pairs = usable[:, :, None] & usable[:, None, :] & np.triu(np.ones((k, k), dtype=bool), 1)
+    left = values[:, :, None]
+    right = values[:, None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        diff = np.abs(((left - right) / ((left + right) / 2)) * 100)
+    diff = np.where(pairs & ~np.isnan(diff), diff, -np.inf)
+    return diff.reshape(n, k * k).max(axis=1)
+
+# This function computes the parts of the filters that do not depend on the filter
+# settings, once per site, so any number of settings can be evaluated from them.
+# Inputs: storms = dataframe of storms with air temp merged in
+def storm_features(storms):
+    n = len(storms)
+    sec = storms['SecPrecip'].to_numpy(dtype=float)
+    tf = storms[tf_columns(storms)].to_numpy(dtype=float)
+    zero = tf == 0
+    active = ~zero
+    pos = np.arange(n)
+    # The first storm is never evaluated and every filter starts at 0
+    evaluated = pos >= 1
+    # Filters b, c, d, f/g, h and p only look at storms with at most 2 zero collectors
+    checked = evaluated & (zero.sum(axis=1) <= 2)
+
+    next_zero = np.zeros_like(zero)
+    next_zero[:-1] = zero[1:]
+    prev_zero = np.zeros_like(zero)
+    prev_zero[1:] = zero[:-1]
+    others = active[:, None, :] & ~np.eye(tf.shape[1], dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        other_mean = np.where(others, tf[:, None, :], 0).sum(axis=2) / others.sum(axis=2)
+        # largest percent difference between any pair of TF collectors in use, for TF and IL
+        tf_diff = max_pair_diff(tf, active)
+        perc_diff = max_pair_diff(sec[:, None] - tf, active)
+    return {'n': n, 'sec': sec, 'tf': tf, 'air': storms['air_temp_min'].to_numpy(dtype=float),
+            'active': active, 'other_mean': other_mean, 'tf_diff': tf_diff, 'perc_diff': perc_diff,
+            'pos': pos, 'evaluated': evaluated, 'checked': checked,
+            # remove storms if not all TF collectors are working in the next storm
+            'b': checked & (pos < n - 1) & (active & next_zero).any(axis=1),
+            # remove storms where not all TF collectors are working (only the
+            # collectors in use for this storm are checked)
+            'c': checked & (active & zero).any(axis=1),
+            # remove storms if not all TF collectors were working in the previous storm
+            'p': checked & (pos > 1) & (active & prev_zero).any(axis=1),
+            # remove storms with more than 2 zero TF readings
+            'q': evaluated & (zero.sum(axis=1) > 2)}
+
+# This function returns one setting of a list of filter settings as a column array.
+def setting_column(settings, name):
+    return np.array([setting[name] for setting in settings], dtype=float)[:, None]
+
+# This function computes filters a through q for every storm and every filter setting
+# at once. Each filter is a (settings x storms) boolean mask. Filters d and e are worked
+# out once per distinct value of perc_thresh and highest and then shared by the settings.
+# Inputs: features = dict from storm_features, settings = list of dicts, each with the
+# filter switches a-q (1 = on, 0 = off) and the filter thresholds (A, B, C, highest,
+# excess, metric, small, med, large, temp_thresh, perc_thresh)
+def filter_masks(features, settings):
+    sec = features['sec']
+    tf = features['tf']
+    active = features['active']
+    evaluated = features['evaluated']
+    checked = features['checked']
+    masks = {}
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # remove storms with snow (air temp below temp_thresh at any time during the storm)
+        masks['a'] = evaluated & (features['air'] < setting_column(settings, 'temp_thresh'))
+
+        masks['b'] = np.broadcast_to(features['b'], (len(settings), features['n']))
+        masks['c'] = np.broadcast_to(features['c'], (len(settings), features['n']))
+
+        # remove storms if a TF collector has large difference from average of other TF collectors
+        values, index = np.unique(setting_column(settings, 'perc_thresh'), return_inverse=True)
+        low = (active & (tf < values[:, None, None] * features['other_mean'])).any(axis=2)
+        masks['d'] = checked & (features['pos'] > 1) & low[index.ravel()]
+
+        # remove storms where more than 1 TF collector exceeds highest% of SecPrecip
+        values, index = np.unique(setting_column(settings, 'highest'), return_inverse=True)
+        measure = (sec[:, None] < values[:, None, None] * tf).sum(axis=2)
+        masks['e'] = evaluated & (measure[index.ravel()] > setting_column(settings, 'excess'))
+
+        h_thresh = setting_column(settings, 'A') * np.exp(-sec * setting_column(settings, 'B')) + setting_column(settings, 'C')
+        fg_thresh = sec * setting_column(settings, 'metric')
+        f_thresh = np.where(sec < 5, setting_column(settings, 'small'),
+                            np.where(sec < 10, setting_column(settings, 'med'),
+                                     np.where(sec > 10, setting_column(settings, 'large'), fg_thresh)))
+        fg_thresh = np.where((setting_column(settings, 'f') == 1) & (setting_column(settings, 'g') != 1), f_thresh, fg_thresh)
+
+        # remove storms that have too large variation in perc difference, meaning wide range in TF values
+        masks['fg'] = checked & (features['perc_diff'] > fg_thresh)
+        # remove storms if there is a large difference between TF collectors
+        masks['h'] = checked & (features['tf_diff'] > h_thresh)
+
+        masks['p'] = np.broadcast_to(features['p'], (len(settings), features['n']))
+        masks['q'] = np.broadcast_to(features['q'], (len(settings), features['n']))
+
+    for name in masks:
+        if name == 'fg':
+            on = (setting_column(settings, 'f') == 1) | (setting_column(settings, 'g') == 1)
+        else:
+            on = setting_column(settings, name) == 1
+        masks[name] = masks[name] & on
+    return masks
+
+# This function returns the filter bits switched on by flags, with the bit of f/g on
+# when either f or g is on.
+def enabled_bits(flags):
+    bits = 0
+    for name, bit in FILTER_BITS.items():
+        if flags[name[0]] == 1 or flags[name[-1]] == 1:
+            bits |= bit
+    return bits
+
+# This function applies filters a through q to every storm at once. Every filter is
+# worked out, also the ones switched off, and the filters that would remove a storm are
+# packed into the uint16 'reasons' column (see FILTER_BITS). 'select' only counts the
+# filters switched on in flags.
+# Inputs: storms = dataframe of storms with air temp merged in, flags = dict with
+# the filter switches a-q (1 = on, 0 = off), params = dict with the filter thresholds
+# (A, B, C, highest, excess, metric, small, med, large, temp_thresh, perc_thresh).
+def apply_filters(storms, flags, params):
+    features = storm_features(storms)
+    # switch every filter on, f/g keeps the threshold chosen by flags
+    all_on = dict(flags, **params, **{name: 1 for name in 'abcdehpq'})
+    all_on['g'] = flags['g'] if flags['f'] == 1 else 1
+    masks = filter_masks(features, [all_on])
+    reasons = np.zeros(features['n'], dtype=np.uint16)
+    for name, bit in FILTER_BITS.items():
+        reasons[masks[name][0]] |= bit
+    storms['reasons'] = reasons
+    storms['select'] = (((reasons & enabled_bits(flags)) != 0) | ~features['evaluated']).astype(np.uint8)
+    return storms
+
+# This function reports how much each filter contributes to the storm selection, from
+# the 'reasons' column of apply_filters, without rerunning the filters.
+# Inputs: storms = dataframe of storms from apply_filters (or the all_storms filter index
+# file of storm_select), flags = filter switches the storms were selected with (None uses
+# FILTER_FLAGS)
+# Output: (unique, combos). unique = dataframe with one row per filter: whether it is
+# switched on, the storms the filter removes (would remove, when it is off) and the
+# storms removed by that filter alone among the filters switched on (0 when it is off).
+# combos = dataframe with one row for each of the 2^9 on/off combinations of the filters
+# (f/g counted as one): the switches, and the number of storms kept and their mean IL_perc
+def ablation_report(storms, flags=None):
+    flags = FILTER_FLAGS if flags is None else flags
+    names = list(FILTER_BITS)
+    bits = np.array(list(FILTER_BITS.values()), dtype=np.uint16)
+    reasons = storms['reasons'].to_numpy(dtype=np.uint16)
+    # the first storm is never evaluated
+    reasons = reasons[1:]
+    il_perc = storms['IL_perc'].to_numpy(dtype=float)[1:]
+    enabled = enabled_bits(flags)
+    unique = pd.DataFrame({'filter': names,
+                           'enabled': (bits & enabled) != 0,
+                           'removed': ((reasons[:, None] & bits) != 0).sum(axis=0),
+                           'removed_only': ((reasons[:, None] & enabled) == (bits & enabled)).sum(axis=0)
+                                           * ((bits & enabled) != 0)})
+
+    # storms with the same reasons are kept or removed together, so each combination is
+    # worked out on the counts of the distinct reasons
+    size = 1 << len(names)
+    counts = np.bincount(reasons, minlength=size)
+    valid = ~np.isnan(il_perc)
+    il_counts = np.bincount(reasons[valid], minlength=size)
+    il_sums = np.bincount(reasons[valid], weights=il_perc[valid], minlength=size)
+    combo = np.arange(size, dtype=np.uint16)
+    kept = (combo[:, None] & np.arange(size, dtype=np.uint16)) == 0
+    combos = pd.DataFrame(((combo[:, None] & bits) != 0).astype(int), columns=names)
+    combos['kept'] = kept @ counts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        combos['IL_perc_mean'] = (kept @ il_sums) / (kept @ il_counts)
+    return unique, combos
+
+# This function reads the air temp of a site straight from the monthly SAAT files, for
+# the storm windows only. Only the files of the months that overlap a storm are read,
+# only the start time and tempSingleMean columns are parsed, and only the rows inside a
+# storm window are kept.
+# Inputs: catalog = catalog of the air temp download folder from load_catalog, site =
+# NEON site, starts, ends = columns of the first and last time of each storm
+# Output: dataframe with startDateTime and air_temp
+def storm_air(catalog, site, starts, ends):
+    first = time_slots(starts)
+    last = time_slots(ends)
+    months = set()
+    for start, end in set(zip(pd.DatetimeIndex(starts).strftime('%Y-%m'), pd.DatetimeIndex(ends).strftime('%Y-%m'))):
+        months.update(pd.period_range(start, end, freq='M').strftime('%Y-%m'))
+    files = [record['file'] for record in catalog_records(catalog, site, 'SAAT_30min', '000.020')
+             if record['month'] in months]
+    if len(files) == 0:
+        return pd.DataFrame({'startDateTime': pd.Series(dtype='datetime64[ns, UTC]'), 'air_temp': pd.Series(dtype=float)})
+    air = read_neon(files, 'tempSingleMean', time_cols=['startDateTime'])
+    # a row is inside a storm if it is not past the latest end of the storms starting
+    # at or before it
+    order = np.argsort(first, kind='stable')
+    reach = np.maximum.accumulate(last[order])
+    slots = time_slots(air['startDateTime'])
+    index = np.searchsorted(first[order], slots, side='right') - 1
+    inside = (index >= 0) & (slots <= reach[np.maximum(index, 0)])
+    air = air[inside].rename(columns={'tempSingleMean': 'air_temp'})
+    return air.reset_index(drop=True)
+
+# This function reads the defined storms of a site and adds the min, mean and max air
+# temp during each storm, and the share of the storm with air temp data.
+# Inputs: site = NEON site, input_air, input_storm, fmt, cache_folder, air_catalog = see
+# storm_select
+def load_storms(site, input_air, input_storm, fmt='csv', cache_folder=None, air_catalog=None):
+    storm = read_frame(frame_path(input_storm+'Output_'+site, fmt), storms=True)
+    #print('storm', storm)
+    storm['startDateTime'] = pd.to_datetime(storm['startDateTime'], errors = 'coerce', utc=True)
+    storms = storm.dropna(subset=['startDateTime']).reset_index(drop=True)
+    ends = storms['startDateTime'] + pd.to_timedelta(pd.to_numeric(storms['duration']), unit='m')
+
+    # read in the air temp of the storm windows from the monthly files, or the combined
+    # air temp file
+    if air_catalog is not None:
+        air_temp = storm_air(air_catalog, site, storms['startDateTime'], ends)
+        span = (time_slots(storms['startDateTime']).min(), time_slots(ends).max()) if len(storms) else (0, 0)
+        air_grid = slot_grid(air_temp, ['air_temp'], *span)
+    else:
+        air_file = frame_path(input_air+'Combined_airTemp_'+site, fmt)
+        air_grid = None
+        if cache_folder is not None:
+            air_grid = load_grid(cache_folder, 'air_' + site, [air_file])
+        if air_grid is None:
+            air_temp = read_frame(air_file, columns=['startDateTime', 'air_temp'])
+            air_grid = slot_grid(air_temp, ['air_temp'])
+            if cache_folder is not None:
+                save_grid(air_grid, cache_folder, 'air_' + site, [air_file])
+
+    # min, mean and max air temp over each storm, from its start to the start of its last
+    # wet slot. Storms with air temp for only part of the storm are kept and flagged with
+    # air_partial, storms with none keep NaN.
+    window = grid_window(air_grid, 'air_temp', storms['startDateTime'], ends)
+    storms['air_temp_min'] = window['min']
+    storms['air_temp_mean'] = window['mean']
+    storms['air_temp_max'] = window['max']
+    storms['air_coverage'] = window['coverage']
+    storms['air_partial'] = (window['coverage'] < 1).astype(np.uint8)
+    #print('storms_', storms.head())
+
+    #replace SecPrecip column with PriPrecip if site has no SecPrecip values
+    if storms['SecPrecip'].sum() == 0:
+        storms['SecPrecip'] = storms['PriPrecip']
+        print('PriPrecip copied to SecPrecip for ', site)
+    return apply_schema(storms, storms=True)
+
 #This function selects storms from the defined data based on defined criteria.
 # Inputs: Sites = list of sites to run the function on, input_air = path to the folder
 # with combined Air temp data per site, input_storm = path to folder with defined storm
 # data per site (from get_new_storms.py), output_folder = path to folder where you want
-# the output selected storm data to be stored.
-def storm_select(Sites, input_air, input_storm, output_folder):
+# the output selected storm data to be stored, fmt = format of the combined air temp and
+# defined storm files ('csv' or 'parquet'), cache_folder = folder for the memory-mapped
+# cache of the air temp series (None does not cache), flags, params = filter switches and
+# thresholds (None uses FILTER_FLAGS and FILTER_PARAMS), air_catalog = catalog of the air
+# temp download folder from load_catalog. When given, the air temp is read from the
+# monthly files of the months with storms (see storm_air) instead of the combined air
+# temp files, so combine_air does not need to run.
+def storm_select(Sites, input_air, input_storm, output_folder, fmt='csv', cache_folder=None, flags=None, params=None,
+                 air_catalog=None):
+    flags = FILTER_FLAGS if flags is None else flags
+    params = FILTER_PARAMS if params is None else params
     for site in Sites:
         print('Site:',site)
-        # read in storms and air temp files
-        air_temp = pd.read_csv(input_air+'Combined_airTemp_'+site+'.csv')
-        air_temp['startDateTime'] = pd.to_datetime(air_temp['startDateTime'])
-        storm = pd.read_csv(input_storm+'Output_'+site+'.csv')
-        #print('storm', storm)
-        storm['startDateTime'] = pd.to_datetime(storm['startDateTime'], errors = 'coerce')
-
-
-        # match air temp to start date of storm, add air temp column
-        storms = storm.merge(air_temp, on = 'startDateTime')
-        #print('storms_', storms.head())
-        storms['SecPrecip'] = pd.to_numeric(storms['SecPrecip'])
-        storms['PriPrecip'] = pd.to_numeric(storms['PriPrecip'])
-        storms['TF1'] = pd.to_numeric(storms['TF1'])
-        storms['TF2'] = pd.to_numeric(storms['TF2'])
-        storms['TF3'] = pd.to_numeric(storms['TF3'])
-        storms['TF4'] = pd.to_numeric(storms['TF4'])
-        storms['TF5'] = pd.to_numeric(storms['TF5'])
-
-        #replace SecPrecip column with PriPrecip if site has no SecPrecip values
-        if storms['SecPrecip'].sum() == 0:
-            storms['SecPrecip'] = storms['PriPrecip']
-            print('PriPrecip copied to SecPrecip for ', site)
-
-        # set all storms to be 'selected', or 1
-        storms['select_a'] = 0
-        storms['select_b'] = 0
-        storms['select_c'] = 0
-        storms['select_d'] = 0
-        storms['select_e'] = 0
-        storms['select_fg'] = 0
-        storms['select_h'] = 0
-        storms['select_p'] = 0
-        storms['select_q'] = 0
-        storms['select'] = 1
-        #
-        # for i in storms:
-        #     storms[i,'SecPrecip'] = float(storms[i,'SecPrecip'])
-        #     storms[i,'TF1'] = float(storms[i,'TF1'])
-
-        #print('storms_2', storms.head())
-
-        # Set the following variables to 1 if you want the filter turned on,
-        # or to zero if you want the associated filter turned off.
-        a = 1 # Removes storms with suspected snow. Set temp_thresh variable for the limit)
-        b = 1 # Removes storms where not all TF collectors are working in the next storm.
-        c = 1 # Removes storms where not all TF collectors are working.
-        d = 0 # Removes storms if a TF collector has large difference from average of other TF collectors. See perc_thresh variable
-        e = 1 # Removes storms where more than 1 TF collector exceeds % of SecPrecip, see highest variable
-        f = 0 # Removes storms that have too wide range in TF values. Similar to d, but calculated based on percent IL for each TF collector. See diff_thresh and small, med, and large variables.
-        g = 0 # Removes storms that have too wide range of TF values (continuous function with storm size, see metric variable).
-        h = 1 # Removes storms if there is a large difference between TF collectors (controlled by storm size and logaritmic decay function. See variables A, B, and C)
-        p = 1 # Removes storms in which not all TF collectors were working in the previous storm.
-        q = 1 # Removes storms with more than 2 zero TF readings
-
-        # Variables A and B are used to calculate logarithmic decay function to define threshold for percent difference in TF
-        # for filter h. diff_thresh = A*e^(-B*storm size)+C
-        A = 1000
-        B = 0.25
-        C = 68
-
-        # The parameters below affect the filtering functions. They can be adjusted as desired.
-        highest = 1.05
-        excess = 2
-        metric = 120
-        small = 300
-        med = 200
-        large = 100
-
-        # set threshholds for evaluating storms
-        temp_thresh = 0.0 #degrees Celcius
-        perc_thresh = .5
-
-        for i in range(1,len(storms)):
-            # remove storms with snow
-            temp = storms.at[i, 'air_temp']
-            if a == 1:
-                if temp != 'nan':
-                    if temp < temp_thresh:
-                        storms.at[i, 'select_a'] = 1
-
-            #reset TF check values to 1 (non-zero)
-            TF1 = 1
-            TF2 = 1
-            TF3 = 1
-            TF4 = 1
-            TF5 = 1
-
-            #check for zero TF
-            if storms.at[i, 'TF1'] == 0:
-                TF1 = 0
-            if storms.at[i, 'TF2'] == 0:
-                TF2 = 0
-            if storms.at[i, 'TF3'] == 0:
-                TF3 = 0
-            if storms.at[i, 'TF4'] == 0:
-                TF4 = 0
-            if storms.at[i, 'TF5'] == 0:
-                TF5 = 0
-
-            #if all TF collectors are non-zero
-            if TF1 == 1 and TF2 == 1 and TF3 == 1 and TF4 == 1 and TF5 == 1:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF1 == 0 or TF2 == 0 or TF3 == 0 or TF4 == 0 or TF5 == 0:
-                        storms.at[i, 'select_c'] = 1
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i-1
-                        if storms.at[m, 'TF1'] == 0 or storms.at[m,'TF2'] == 0 or storms.at[m,'TF3'] == 0 or storms.at[m,'TF4'] == 0 or storms.at[m,'TF5'] == 0:
-                            storms.at[i,'select_p'] = 1
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i+1
-                        if storms.at[j,'TF1'] == 0 or storms.at[j,'TF2'] == 0 or storms.at[j,'TF3'] == 0 or storms.at[j,'TF4'] == 0 or storms.at[j,'TF5'] == 0:
-                            storms.at[i,'select_b'] = 1
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i,'TF1'] < perc_thresh*((storms.at[i,'TF2']+storms.at[i,'TF3']+storms.at[i,'TF4']+storms.at[i,'TF5'])/4):
-                            storms.at[i,'select_d'] = 1
-                        if storms.at[i,'TF2'] < perc_thresh*((storms.at[i,'TF1']+storms.at[i,'TF3']+storms.at[i,'TF4']+storms.at[i,'TF5'])/4):
-                            storms.at[i,'select_d'] = 1
-                        if storms.at[i,'TF3'] < perc_thresh*((storms.at[i,'TF1']+storms.at[i,'TF2']+storms.at[i,'TF4']+storms.at[i,'TF5'])/4):
-                            storms.at[i,'select_d'] = 1
-                        if storms.at[i,'TF4'] < perc_thresh*((storms.at[i,'TF1']+storms.at[i,'TF2']+storms.at[i,'TF3']+storms.at[i,'TF5'])/4):
-                            storms.at[i,'select_d'] = 1
-                        if storms.at[i,'TF5'] < perc_thresh*((storms.at[i,'TF1']+storms.at[i,'TF2']+storms.at[i,'TF3']+storms.at[i,'TF4'])/4):
-                            storms.at[i,'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL1 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF1']
-                IL2 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF2']
-                IL3 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF3']
-                IL4 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF4']
-                IL5 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF5']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffa = abs(((IL1 - IL2) / ((IL1 + IL2) / 2)) * 100)
-                percDiffb = abs(((IL1 - IL3) / ((IL1 + IL3) / 2)) * 100)
-                percDiffc = abs(((IL1 - IL4) / ((IL1 + IL4) / 2)) * 100)
-                percDiffd = abs(((IL1 - IL5) / ((IL1 + IL5) / 2)) * 100)
-                percDiffe = abs(((IL2 - IL3) / ((IL2 + IL3) / 2)) * 100)
-                percDifff = abs(((IL2 - IL4) / ((IL2 + IL4) / 2)) * 100)
-                percDiffg = abs(((IL2 - IL5) / ((IL2 + IL5) / 2)) * 100)
-                percDiffh = abs(((IL3 - IL4) / ((IL3 + IL4) / 2)) * 100)
-                percDiffi = abs(((IL3 - IL5) / ((IL3 + IL5) / 2)) * 100)
-                percDiffj = abs(((IL4 - IL5) / ((IL4 + IL4) / 2)) * 100)
-
-                tf1 = storms.at[i, 'TF1']
-                tf2 = storms.at[i, 'TF2']
-                tf3 = storms.at[i, 'TF3']
-                tf4 = storms.at[i, 'TF4']
-                tf5 = storms.at[i, 'TF5']
-
-                TFdiffa = abs(((tf1 - tf2) / ((tf1 + tf2) / 2)) * 100)
-                TFdiffb = abs(((tf1 - tf3) / ((tf1 + tf3) / 2)) * 100)
-                TFdiffc = abs(((tf1 - tf4) / ((tf1 + tf4) / 2)) * 100)
-                TFdiffd = abs(((tf1 - tf5) / ((tf1 + tf5) / 2)) * 100)
-                TFdiffe = abs(((tf2 - tf3) / ((tf2 + tf3) / 2)) * 100)
-                TFdifff = abs(((tf2 - tf4) / ((tf2 + tf4) / 2)) * 100)
-                TFdiffg = abs(((tf2 - tf5) / ((tf2 + tf5) / 2)) * 100)
-                TFdiffh = abs(((tf3 - tf4) / ((tf3 + tf4) / 2)) * 100)
-                TFdiffi = abs(((tf3 - tf5) / ((tf3 + tf5) / 2)) * 100)
-                TFdiffj = abs(((tf4 - tf5) / ((tf4 + tf5) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDiffa > diff_thresh or percDiffb > diff_thresh or percDiffc > diff_thresh or percDiffd > diff_thresh or percDiffe > diff_thresh or percDifff > diff_thresh or percDiffg > diff_thresh or percDiffh > diff_thresh or percDiffi > diff_thresh or percDiffj > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffa > diff_thresh or TFdiffb > diff_thresh or TFdiffc > diff_thresh or TFdiffd > diff_thresh or TFdiffe > diff_thresh or TFdifff > diff_thresh or TFdiffg > diff_thresh or TFdiffh > diff_thresh or TFdiffi > diff_thresh or TFdiffj > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF5 is zero
-            if TF1 == 1 and TF2 == 1 and TF3 ==1 and TF4 == 1 and TF5 == 0:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF1 == 0 or TF2 == 0 or TF3 == 0 or TF4 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF1'] == 0 or storms.at[m, 'TF2'] == 0 or storms.at[m, 'TF3'] == 0 or storms.at[m, 'TF4'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF1'] == 0 or storms.at[j, 'TF2'] == 0 or storms.at[j, 'TF3'] == 0 or storms.at[j, 'TF4'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF1'] < perc_thresh * (
-                                (storms.at[i, 'TF2'] + storms.at[i, 'TF3'] + storms.at[i, 'TF4'])/ 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF2'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF3'] + storms.at[i, 'TF4']) / 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF3'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF2'] + storms.at[i, 'TF4']) / 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF4'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF2'] + storms.at[i, 'TF3']) / 3):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL1 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF1']
-                IL2 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF2']
-                IL3 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF3']
-                IL4 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF4']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffa = abs(((IL1 - IL2) / ((IL1 + IL2) / 2)) * 100)
-                percDiffb = abs(((IL1 - IL3) / ((IL1 + IL3) / 2)) * 100)
-                percDiffc = abs(((IL1 - IL4) / ((IL1 + IL4) / 2)) * 100)
-                percDiffe = abs(((IL2 - IL3) / ((IL2 + IL3) / 2)) * 100)
-                percDifff = abs(((IL2 - IL4) / ((IL2 + IL4) / 2)) * 100)
-                percDiffh = abs(((IL3 - IL4) / ((IL3 + IL4) / 2)) * 100)
-
-                tf1 = storms.at[i, 'TF1']
-                tf2 = storms.at[i, 'TF2']
-                tf3 = storms.at[i, 'TF3']
-                tf4 = storms.at[i, 'TF4']
-
-                TFdiffa = abs(((tf1 - tf2) / ((tf1 + tf2) / 2)) * 100)
-                TFdiffb = abs(((tf1 - tf3) / ((tf1 + tf3) / 2)) * 100)
-                TFdiffc = abs(((tf1 - tf4) / ((tf1 + tf4) / 2)) * 100)
-                TFdiffe = abs(((tf2 - tf3) / ((tf2 + tf3) / 2)) * 100)
-                TFdifff = abs(((tf2 - tf4) / ((tf2 + tf4) / 2)) * 100)
-                TFdiffh = abs(((tf3 - tf4) / ((tf3 + tf4) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDiffa > diff_thresh or percDiffb > diff_thresh or percDiffc > diff_thresh or percDiffe > diff_thresh or percDifff > diff_thresh or percDiffh > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffa > diff_thresh or TFdiffb > diff_thresh or TFdiffc > diff_thresh or TFdiffe > diff_thresh or TFdifff > diff_thresh or TFdiffh > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF4 is zero
-            if TF1 == 1 and TF2 == 1 and TF3 ==1 and TF4 == 0 and TF5 == 1:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF1 == 0 or TF2 == 0 or TF3 == 0 or TF5 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p ==1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF1'] == 0 or storms.at[m, 'TF2'] == 0 or storms.at[m, 'TF3'] == 0 or storms.at[m, 'TF5'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF1'] == 0 or storms.at[j, 'TF2'] == 0 or storms.at[j, 'TF3'] == 0 or storms.at[j, 'TF5'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF1'] < perc_thresh * (
-                                (storms.at[i, 'TF2'] + storms.at[i, 'TF3'] + storms.at[i, 'TF5'])/ 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF2'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF3'] + storms.at[i, 'TF5']) / 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF3'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF2'] + storms.at[i, 'TF5']) / 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF5'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF2'] + storms.at[i, 'TF3']) / 3):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL1 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF1']
-                IL2 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF2']
-                IL3 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF3']
-                IL5 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF5']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffa = abs(((IL1 - IL2) / ((IL1 + IL2) / 2)) * 100)
-                percDiffb = abs(((IL1 - IL3) / ((IL1 + IL3) / 2)) * 100)
-                percDiffd = abs(((IL1 - IL5) / ((IL1 + IL5) / 2)) * 100)
-                percDiffe = abs(((IL2 - IL3) / ((IL2 + IL3) / 2)) * 100)
-                percDiffg = abs(((IL2 - IL5) / ((IL2 + IL5) / 2)) * 100)
-                percDiffi = abs(((IL3 - IL5) / ((IL3 + IL5) / 2)) * 100)
-
-                tf1 = storms.at[i, 'TF1']
-                tf2 = storms.at[i, 'TF2']
-                tf3 = storms.at[i, 'TF3']
-                tf5 = storms.at[i, 'TF5']
-
-                TFdiffa = abs(((tf1 - tf2) / ((tf1 + tf2) / 2)) * 100)
-                TFdiffb = abs(((tf1 - tf3) / ((tf1 + tf3) / 2)) * 100)
-                TFdiffd = abs(((tf1 - tf5) / ((tf1 + tf5) / 2)) * 100)
-                TFdiffe = abs(((tf2 - tf3) / ((tf2 + tf3) / 2)) * 100)
-                TFdiffg = abs(((tf2 - tf5) / ((tf2 + tf5) / 2)) * 100)
-                TFdiffi = abs(((tf3 - tf5) / ((tf3 + tf5) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDiffa > diff_thresh or percDiffb > diff_thresh or percDiffd > diff_thresh or percDiffe > diff_thresh or percDiffg > diff_thresh or percDiffi > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffa > diff_thresh or TFdiffb > diff_thresh or TFdiffd > diff_thresh or TFdiffe > diff_thresh or TFdiffg > diff_thresh or TFdiffi > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-
-            #if TF3 is zero
-            if TF1 == 1 and TF2 == 1 and TF3 == 0 and TF4 == 1 and TF5 == 1:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF1 == 0 or TF2 == 0 or TF5 == 0 or TF4 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF1'] == 0 or storms.at[m, 'TF2'] == 0 or storms.at[m, 'TF5'] == 0 or storms.at[m, 'TF4'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF1'] == 0 or storms.at[j, 'TF2'] == 0 or storms.at[j, 'TF5'] == 0 or storms.at[j, 'TF4'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF1'] < perc_thresh * (
-                                (storms.at[i, 'TF2'] + storms.at[i, 'TF5'] + storms.at[i, 'TF4'])/ 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF2'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF5'] + storms.at[i, 'TF4']) / 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF5'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF2'] + storms.at[i, 'TF4']) / 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF4'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF2'] + storms.at[i, 'TF5']) / 3):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL1 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF1']
-                IL2 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF2']
-                IL4 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF4']
-                IL5 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF5']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffa = abs(((IL1 - IL2) / ((IL1 + IL2) / 2)) * 100)
-                percDiffc = abs(((IL1 - IL4) / ((IL1 + IL4) / 2)) * 100)
-                percDiffd = abs(((IL1 - IL5) / ((IL1 + IL5) / 2)) * 100)
-                percDifff = abs(((IL2 - IL4) / ((IL2 + IL4) / 2)) * 100)
-                percDiffg = abs(((IL2 - IL5) / ((IL2 + IL5) / 2)) * 100)
-                percDiffj = abs(((IL4 - IL5) / ((IL4 + IL4) / 2)) * 100)
-
-                tf1 = storms.at[i, 'TF1']
-                tf2 = storms.at[i, 'TF2']
-                tf4 = storms.at[i, 'TF4']
-                tf5 = storms.at[i, 'TF5']
-
-                TFdiffa = abs(((tf1 - tf2) / ((tf1 + tf2) / 2)) * 100)
-                TFdiffc = abs(((tf1 - tf4) / ((tf1 + tf4) / 2)) * 100)
-                TFdiffd = abs(((tf1 - tf5) / ((tf1 + tf5) / 2)) * 100)
-                TFdifff = abs(((tf2 - tf4) / ((tf2 + tf4) / 2)) * 100)
-                TFdiffg = abs(((tf2 - tf5) / ((tf2 + tf5) / 2)) * 100)
-                TFdiffj = abs(((tf4 - tf5) / ((tf4 + tf5) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDiffa > diff_thresh or percDiffc > diff_thresh or percDiffd > diff_thresh or percDifff > diff_thresh or percDiffg > diff_thresh or percDiffj > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffa > diff_thresh or TFdiffc > diff_thresh or TFdiffd > diff_thresh or TFdifff > diff_thresh or TFdiffg > diff_thresh or TFdiffj > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF2 is zero
-            if TF1 == 1 and TF2 == 0 and TF3 ==1 and TF4 == 1 and TF5 == 1:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF1 == 0 or TF5 == 0 or TF3 == 0 or TF4 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF1'] == 0 or storms.at[m, 'TF5'] == 0 or storms.at[m, 'TF3'] == 0 or storms.at[m, 'TF4'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF1'] == 0 or storms.at[j, 'TF5'] == 0 or storms.at[j, 'TF3'] == 0 or storms.at[j, 'TF4'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF1'] < perc_thresh * (
-                                (storms.at[i, 'TF5'] + storms.at[i, 'TF3'] + storms.at[i, 'TF4'])/ 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF5'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF3'] + storms.at[i, 'TF4']) / 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF3'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF5'] + storms.at[i, 'TF4']) / 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF4'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF5'] + storms.at[i, 'TF3']) / 3):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL1 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF1']
-                IL3 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF3']
-                IL4 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF4']
-                IL5 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF5']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffb = abs(((IL1 - IL3) / ((IL1 + IL3) / 2)) * 100)
-                percDiffc = abs(((IL1 - IL4) / ((IL1 + IL4) / 2)) * 100)
-                percDiffd = abs(((IL1 - IL5) / ((IL1 + IL5) / 2)) * 100)
-                percDiffh = abs(((IL3 - IL4) / ((IL3 + IL4) / 2)) * 100)
-                percDiffi = abs(((IL3 - IL5) / ((IL3 + IL5) / 2)) * 100)
-                percDiffj = abs(((IL4 - IL5) / ((IL4 + IL4) / 2)) * 100)
-
-                tf1 = storms.at[i, 'TF1']
-                tf3 = storms.at[i, 'TF3']
-                tf4 = storms.at[i, 'TF4']
-                tf5 = storms.at[i, 'TF5']
-
-                TFdiffb = abs(((tf1 - tf3) / ((tf1 + tf3) / 2)) * 100)
-                TFdiffc = abs(((tf1 - tf4) / ((tf1 + tf4) / 2)) * 100)
-                TFdiffd = abs(((tf1 - tf5) / ((tf1 + tf5) / 2)) * 100)
-                TFdiffh = abs(((tf3 - tf4) / ((tf3 + tf4) / 2)) * 100)
-                TFdiffi = abs(((tf3 - tf5) / ((tf3 + tf5) / 2)) * 100)
-                TFdiffj = abs(((tf4 - tf5) / ((tf4 + tf5) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip']*metric
-
-                if f == 1 or g == 1:
-                    if percDiffb > diff_thresh or percDiffc > diff_thresh or percDiffd > diff_thresh or percDiffh > diff_thresh or percDiffi > diff_thresh or percDiffj > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffb > diff_thresh or TFdiffc > diff_thresh or TFdiffd > diff_thresh or TFdiffh > diff_thresh or TFdiffi > diff_thresh or TFdiffj > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF1 is zero
-            if TF1 == 0 and TF2 == 1 and TF3 ==1 and TF4 == 1 and TF5 == 1:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF5 == 0 or TF2 == 0 or TF3 == 0 or TF4 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF5'] == 0 or storms.at[m, 'TF2'] == 0 or storms.at[m, 'TF3'] == 0 or storms.at[m, 'TF4'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF5'] == 0 or storms.at[j, 'TF2'] == 0 or storms.at[j, 'TF3'] == 0 or storms.at[j, 'TF4'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF5'] < perc_thresh * (
-                                (storms.at[i, 'TF2'] + storms.at[i, 'TF3'] + storms.at[i, 'TF4'])/ 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF2'] < perc_thresh * (
-                                (storms.at[i, 'TF5'] + storms.at[i, 'TF3'] + storms.at[i, 'TF4']) / 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF3'] < perc_thresh * (
-                                (storms.at[i, 'TF5'] + storms.at[i, 'TF2'] + storms.at[i, 'TF4']) / 3):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF4'] < perc_thresh * (
-                                (storms.at[i, 'TF5'] + storms.at[i, 'TF2'] + storms.at[i, 'TF3']) / 3):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL2 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF2']
-                IL3 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF3']
-                IL4 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF4']
-                IL5 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF5']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffe = abs(((IL2 - IL3) / ((IL2 + IL3) / 2)) * 100)
-                percDifff = abs(((IL2 - IL4) / ((IL2 + IL4) / 2)) * 100)
-                percDiffg = abs(((IL2 - IL5) / ((IL2 + IL5) / 2)) * 100)
-                percDiffh = abs(((IL3 - IL4) / ((IL3 + IL4) / 2)) * 100)
-                percDiffi = abs(((IL3 - IL5) / ((IL3 + IL5) / 2)) * 100)
-                percDiffj = abs(((IL4 - IL5) / ((IL4 + IL4) / 2)) * 100)
-
-                tf2 = storms.at[i, 'TF2']
-                tf3 = storms.at[i, 'TF3']
-                tf4 = storms.at[i, 'TF4']
-                tf5 = storms.at[i, 'TF5']
-
-                TFdiffe = abs(((tf2 - tf3) / ((tf2 + tf3) / 2)) * 100)
-                TFdifff = abs(((tf2 - tf4) / ((tf2 + tf4) / 2)) * 100)
-                TFdiffg = abs(((tf2 - tf5) / ((tf2 + tf5) / 2)) * 100)
-                TFdiffh = abs(((tf3 - tf4) / ((tf3 + tf4) / 2)) * 100)
-                TFdiffi = abs(((tf3 - tf5) / ((tf3 + tf5) / 2)) * 100)
-                TFdiffj = abs(((tf4 - tf5) / ((tf4 + tf5) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDiffe > diff_thresh or percDifff > diff_thresh or percDiffg > diff_thresh or percDiffh > diff_thresh or percDiffi > diff_thresh or percDiffj > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffe > diff_thresh or TFdifff > diff_thresh or TFdiffg > diff_thresh or TFdiffh > diff_thresh or TFdiffi > diff_thresh or TFdiffj > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF1 and TF2 are zero
-            if TF1 == 0 and TF2 == 0 and TF3 ==1 and TF4 == 1 and TF5 == 1:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF5 == 0 or TF3 == 0 or TF4 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF5'] == 0 or storms.at[m, 'TF3'] == 0 or storms.at[m, 'TF4'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF5'] == 0 or storms.at[j, 'TF3'] == 0 or storms.at[j, 'TF4'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF3'] < perc_thresh * (
-                                (storms.at[i, 'TF4'] + storms.at[i, 'TF5']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF4'] < perc_thresh * (
-                                (storms.at[i, 'TF3'] + storms.at[i, 'TF5']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF5'] < perc_thresh * (
-                                (storms.at[i, 'TF3'] + storms.at[i, 'TF4']) / 2):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL3 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF3']
-                IL4 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF4']
-                IL5 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF5']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffh = abs(((IL3 - IL4) / ((IL3 + IL4) / 2)) * 100)
-                percDiffi = abs(((IL3 - IL5) / ((IL3 + IL5) / 2)) * 100)
-                percDiffj = abs(((IL4 - IL5) / ((IL4 + IL4) / 2)) * 100)
-
-                tf3 = storms.at[i, 'TF3']
-                tf4 = storms.at[i, 'TF4']
-                tf5 = storms.at[i, 'TF5']
-
-                TFdiffh = abs(((tf3 - tf4) / ((tf3 + tf4) / 2)) * 100)
-                TFdiffi = abs(((tf3 - tf5) / ((tf3 + tf5) / 2)) * 100)
-                TFdiffj = abs(((tf4 - tf5) / ((tf4 + tf5) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDiffh > diff_thresh or percDiffi > diff_thresh or percDiffj > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffh > diff_thresh or TFdiffi > diff_thresh or TFdiffj > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF1 and TF3 are zero
-            if TF1 == 0 and TF2 == 1 and TF3 ==0 and TF4 == 1 and TF5 == 1:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF5 == 0 or TF2 == 0 or TF4 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF5'] == 0 or storms.at[m, 'TF2'] == 0 or storms.at[m, 'TF4'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF5'] == 0 or storms.at[j, 'TF2'] == 0 or storms.at[j, 'TF4'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF2'] < perc_thresh * (
-                                (storms.at[i, 'TF4'] + storms.at[i, 'TF5']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF4'] < perc_thresh * (
-                                (storms.at[i, 'TF2'] + storms.at[i, 'TF5']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF5'] < perc_thresh * (
-                                (storms.at[i, 'TF2'] + storms.at[i, 'TF4']) / 2):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL2 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF2']
-                IL4 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF4']
-                IL5 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF5']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDifff = abs(((IL2 - IL4) / ((IL2 + IL4) / 2)) * 100)
-                percDiffg = abs(((IL2 - IL5) / ((IL2 + IL5) / 2)) * 100)
-                percDiffj = abs(((IL4 - IL5) / ((IL4 + IL4) / 2)) * 100)
-
-                tf2 = storms.at[i, 'TF2']
-                tf4 = storms.at[i, 'TF4']
-                tf5 = storms.at[i, 'TF5']
-
-                TFdifff = abs(((tf2 - tf4) / ((tf2 + tf4) / 2)) * 100)
-                TFdiffg = abs(((tf2 - tf5) / ((tf2 + tf5) / 2)) * 100)
-                TFdiffj = abs(((tf4 - tf5) / ((tf4 + tf5) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDifff > diff_thresh or percDiffg > diff_thresh or percDiffj > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdifff > diff_thresh or TFdiffg > diff_thresh or TFdiffj > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF1 and TF4 are zero
-            if TF1 == 0 and TF2 == 1 and TF3 ==1 and TF4 == 0 and TF5 == 1:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF5 == 0 or TF3 == 0 or TF2 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF5'] == 0 or storms.at[m, 'TF3'] == 0 or storms.at[m, 'TF2'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF5'] == 0 or storms.at[j, 'TF3'] == 0 or storms.at[j, 'TF2'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF3'] < perc_thresh * (
-                                (storms.at[i, 'TF2'] + storms.at[i, 'TF5']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF2'] < perc_thresh * (
-                                (storms.at[i, 'TF3'] + storms.at[i, 'TF5']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF5'] < perc_thresh * (
-                                (storms.at[i, 'TF3'] + storms.at[i, 'TF2']) / 2):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL2 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF2']
-                IL3 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF3']
-                IL5 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF5']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffe = abs(((IL2 - IL3) / ((IL2 + IL3) / 2)) * 100)
-                percDiffg = abs(((IL2 - IL5) / ((IL2 + IL5) / 2)) * 100)
-                percDiffi = abs(((IL3 - IL5) / ((IL3 + IL5) / 2)) * 100)
-
-                tf2 = storms.at[i, 'TF2']
-                tf3 = storms.at[i, 'TF3']
-                tf5 = storms.at[i, 'TF5']
-
-                TFdiffe = abs(((tf2 - tf3) / ((tf2 + tf3) / 2)) * 100)
-                TFdiffg = abs(((tf2 - tf5) / ((tf2 + tf5) / 2)) * 100)
-                TFdiffi = abs(((tf3 - tf5) / ((tf3 + tf5) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDiffe > diff_thresh or percDiffg > diff_thresh or percDiffi > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffe > diff_thresh or TFdiffg > diff_thresh or TFdiffi > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF1 and TF5 are zero
-            if TF1 == 0 and TF2 == 1 and TF3 ==1 and TF4 == 1 and TF5 == 0:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF2 == 0 or TF3 == 0 or TF4 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF2'] == 0 or storms.at[m, 'TF3'] == 0 or storms.at[m, 'TF4'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF2'] == 0 or storms.at[j, 'TF3'] == 0 or storms.at[j, 'TF4'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF3'] < perc_thresh * (
-                                (storms.at[i, 'TF4'] + storms.at[i, 'TF2']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF4'] < perc_thresh * (
-                                (storms.at[i, 'TF3'] + storms.at[i, 'TF2']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF2'] < perc_thresh * (
-                                (storms.at[i, 'TF3'] + storms.at[i, 'TF4']) / 2):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL2 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF2']
-                IL3 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF3']
-                IL4 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF4']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffe = abs(((IL2 - IL3) / ((IL2 + IL3) / 2)) * 100)
-                percDifff = abs(((IL2 - IL4) / ((IL2 + IL4) / 2)) * 100)
-                percDiffh = abs(((IL3 - IL4) / ((IL3 + IL4) / 2)) * 100)
-
-                tf2 = storms.at[i, 'TF2']
-                tf3 = storms.at[i, 'TF3']
-                tf4 = storms.at[i, 'TF4']
-
-                TFdiffe = abs(((tf2 - tf3) / ((tf2 + tf3) / 2)) * 100)
-                TFdifff = abs(((tf2 - tf4) / ((tf2 + tf4) / 2)) * 100)
-                TFdiffh = abs(((tf3 - tf4) / ((tf3 + tf4) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDiffe > diff_thresh or percDifff > diff_thresh or percDiffh > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffe > diff_thresh or TFdifff > diff_thresh or TFdiffh > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF2 and TF3 are zero
-            if TF1 == 1 and TF2 == 0 and TF3 ==0 and TF4 == 1 and TF5 == 1:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF5 == 0 or TF1 == 0 or TF4 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF5'] == 0 or storms.at[m, 'TF1'] == 0 or storms.at[m, 'TF4'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF5'] == 0 or storms.at[j, 'TF1'] == 0 or storms.at[j, 'TF4'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF1'] < perc_thresh * (
-                                (storms.at[i, 'TF4'] + storms.at[i, 'TF5']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF4'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF5']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF5'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF4']) / 2):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL1 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF1']
-                IL4 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF4']
-                IL5 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF5']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffc = abs(((IL1 - IL4) / ((IL1 + IL4) / 2)) * 100)
-                percDiffd = abs(((IL1 - IL5) / ((IL1 + IL5) / 2)) * 100)
-                percDiffj = abs(((IL4 - IL5) / ((IL4 + IL4) / 2)) * 100)
-
-                tf1 = storms.at[i, 'TF1']
-                tf4 = storms.at[i, 'TF4']
-                tf5 = storms.at[i, 'TF5']
-
-                TFdiffc = abs(((tf1 - tf4) / ((tf1 + tf4) / 2)) * 100)
-                TFdiffd = abs(((tf1 - tf5) / ((tf1 + tf5) / 2)) * 100)
-                TFdiffj = abs(((tf4 - tf5) / ((tf4 + tf5) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDiffc > diff_thresh or percDiffd > diff_thresh or percDiffj > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffc > diff_thresh or TFdiffd > diff_thresh or TFdiffj > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF2 and TF4 are zero
-            if TF1 == 1 and TF2 == 0 and TF3 ==1 and TF4 == 0 and TF5 == 1:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF5 == 0 or TF3 == 0 or TF1 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF5'] == 0 or storms.at[m, 'TF3'] == 0 or storms.at[m, 'TF1'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF5'] == 0 or storms.at[j, 'TF3'] == 0 or storms.at[j, 'TF1'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF3'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF5']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF1'] < perc_thresh * (
-                                (storms.at[i, 'TF3'] + storms.at[i, 'TF5']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF5'] < perc_thresh * (
-                                (storms.at[i, 'TF3'] + storms.at[i, 'TF1']) / 2):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL1 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF1']
-                IL3 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF3']
-                IL5 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF5']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffb = abs(((IL1 - IL3) / ((IL1 + IL3) / 2)) * 100)
-                percDiffd = abs(((IL1 - IL5) / ((IL1 + IL5) / 2)) * 100)
-                percDiffi = abs(((IL3 - IL5) / ((IL3 + IL5) / 2)) * 100)
-
-                tf1 = storms.at[i, 'TF1']
-                tf3 = storms.at[i, 'TF3']
-                tf5 = storms.at[i, 'TF5']
-
-                TFdiffb = abs(((tf1 - tf3) / ((tf1 + tf3) / 2)) * 100)
-                TFdiffd = abs(((tf1 - tf5) / ((tf1 + tf5) / 2)) * 100)
-                TFdiffi = abs(((tf3 - tf5) / ((tf3 + tf5) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDiffb > diff_thresh or percDiffd > diff_thresh or percDiffi > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffb > diff_thresh or TFdiffd > diff_thresh or TFdiffi > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF2 and TF5 are zero
-            if TF1 == 1 and TF2 == 0 and TF3 ==1 and TF4 == 1 and TF5 == 0:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF4 == 0 or TF3 == 0 or TF1 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF4'] == 0 or storms.at[m, 'TF3'] == 0 or storms.at[m, 'TF1'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF4'] == 0 or storms.at[j, 'TF3'] == 0 or storms.at[j, 'TF1'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF3'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF4']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF1'] < perc_thresh * (
-                                (storms.at[i, 'TF3'] + storms.at[i, 'TF4']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF4'] < perc_thresh * (
-                                (storms.at[i, 'TF3'] + storms.at[i, 'TF1']) / 2):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL1 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF1']
-                IL3 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF3']
-                IL4 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF4']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffb = abs(((IL1 - IL3) / ((IL1 + IL3) / 2)) * 100)
-                percDiffc = abs(((IL1 - IL4) / ((IL1 + IL4) / 2)) * 100)
-                percDiffh = abs(((IL3 - IL4) / ((IL3 + IL4) / 2)) * 100)
-
-                tf1 = storms.at[i, 'TF1']
-                tf3 = storms.at[i, 'TF3']
-                tf4 = storms.at[i, 'TF4']
-
-                TFdiffb = abs(((tf1 - tf3) / ((tf1 + tf3) / 2)) * 100)
-                TFdiffc = abs(((tf1 - tf4) / ((tf1 + tf4) / 2)) * 100)
-                TFdiffh = abs(((tf3 - tf4) / ((tf3 + tf4) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDiffb > diff_thresh or percDiffc > diff_thresh or percDiffh > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffb > diff_thresh or TFdiffc > diff_thresh or TFdiffh > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF3 and TF4 are zero
-            if TF1 == 1 and TF2 == 1 and TF3 ==0 and TF4 == 0 and TF5 == 1:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF5 == 0 or TF2 == 0 or TF1 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF5'] == 0 or storms.at[m, 'TF2'] == 0 or storms.at[m, 'TF1'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF5'] == 0 or storms.at[j, 'TF2'] == 0 or storms.at[j, 'TF1'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF2'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF5']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF1'] < perc_thresh * (
-                                (storms.at[i, 'TF2'] + storms.at[i, 'TF5']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF5'] < perc_thresh * (
-                                (storms.at[i, 'TF2'] + storms.at[i, 'TF1']) / 2):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL1 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF1']
-                IL2 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF2']
-                IL5 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF5']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffa = abs(((IL1 - IL2) / ((IL1 + IL2) / 2)) * 100)
-                percDiffd = abs(((IL1 - IL5) / ((IL1 + IL5) / 2)) * 100)
-                percDiffg = abs(((IL2 - IL5) / ((IL2 + IL5) / 2)) * 100)
-
-                tf1 = storms.at[i, 'TF1']
-                tf2 = storms.at[i, 'TF2']
-                tf5 = storms.at[i, 'TF5']
-
-                TFdiffa = abs(((tf1 - tf2) / ((tf1 + tf2) / 2)) * 100)
-                TFdiffd = abs(((tf1 - tf5) / ((tf1 + tf5) / 2)) * 100)
-                TFdiffg = abs(((tf2 - tf5) / ((tf2 + tf5) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDiffa > diff_thresh or percDiffd > diff_thresh or percDiffg > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffa > diff_thresh or TFdiffd > diff_thresh or TFdiffg > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF3 and TF5 are zero
-            if TF1 == 1 and TF2 == 1 and TF3 ==0 and TF4 == 1 and TF5 == 0:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF2 == 0 or TF4 == 0 or TF1 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF2'] == 0 or storms.at[m, 'TF4'] == 0 or storms.at[m, 'TF1'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF2'] == 0 or storms.at[j, 'TF4'] == 0 or storms.at[j, 'TF1'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF4'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF2']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF1'] < perc_thresh * (
-                                (storms.at[i, 'TF4'] + storms.at[i, 'TF2']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF2'] < perc_thresh * (
-                                (storms.at[i, 'TF4'] + storms.at[i, 'TF1']) / 2):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL1 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF1']
-                IL2 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF2']
-                IL4 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF4']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffa = abs(((IL1 - IL2) / ((IL1 + IL2) / 2)) * 100)
-                percDiffc = abs(((IL1 - IL4) / ((IL1 + IL4) / 2)) * 100)
-                percDifff = abs(((IL2 - IL4) / ((IL2 + IL4) / 2)) * 100)
-
-                tf1 = storms.at[i, 'TF1']
-                tf2 = storms.at[i, 'TF2']
-                tf4 = storms.at[i, 'TF4']
-
-                TFdiffa = abs(((tf1 - tf2) / ((tf1 + tf2) / 2)) * 100)
-                TFdiffc = abs(((tf1 - tf4) / ((tf1 + tf4) / 2)) * 100)
-                TFdifff = abs(((tf2 - tf4) / ((tf2 + tf4) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                if f == 1 or g == 1:
-                    if percDiffa > diff_thresh or percDiffc > diff_thresh or percDifff > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffa > diff_thresh or TFdiffc > diff_thresh or TFdifff > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #if TF5 and TF4 are zero
-            if TF1 == 1 and TF2 == 1 and TF3 ==1 and TF4 == 0 and TF5 == 0:
-                # remove storms where not all TF collectors are working
-                if c == 1:
-                    if TF2 == 0 or TF3 == 0 or TF1 == 0:
-                        storms.at[i, 'select_c'] = 1
-
-                # remove storms if not all TF collectors were working in the previous storm
-                if p == 1:
-                    if i > 1:
-                        m = i - 1
-                        if storms.at[m, 'TF2'] == 0 or storms.at[m, 'TF3'] == 0 or storms.at[m, 'TF1'] == 0:
-                            storms.at[i, 'select_p'] = 1
-
-                # remove storms if not all TF collectors are working in the next storm
-                if b == 1:
-                    if i < (len(storms)-1):
-                        j = i + 1
-                        if storms.at[j, 'TF2'] == 0 or storms.at[j, 'TF3'] == 0 or storms.at[j, 'TF1'] == 0:
-                            storms.at[i, 'select_b'] = 1
-
-                # remove storms if a TF collector has large difference from average of other TF collectors
-                if d == 1:
-                    if i > 1:
-                        if storms.at[i, 'TF3'] < perc_thresh * (
-                                (storms.at[i, 'TF1'] + storms.at[i, 'TF2']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF1'] < perc_thresh * (
-                                (storms.at[i, 'TF3'] + storms.at[i, 'TF2']) / 2):
-                            storms.at[i, 'select_d'] = 1
-                        if storms.at[i, 'TF2'] < perc_thresh * (
-                                (storms.at[i, 'TF3'] + storms.at[i, 'TF1']) / 2):
-                            storms.at[i, 'select_d'] = 1
-
-                # Calculate IL amount for each TF collector
-                IL1 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF1']
-                IL2 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF2']
-                IL3 = storms.at[i, 'SecPrecip'] - storms.at[i, 'TF3']
-
-                # Calculate the percent difference between IL at each TF collector
-                percDiffa = abs(((IL1 - IL2) / ((IL1 + IL2) / 2)) * 100)
-                percDiffb = abs(((IL1 - IL3) / ((IL1 + IL3) / 2)) * 100)
-                percDiffe = abs(((IL2 - IL3) / ((IL2 + IL3) / 2)) * 100)
-
-                tf1 = storms.at[i, 'TF1']
-                tf2 = storms.at[i, 'TF2']
-                tf3 = storms.at[i, 'TF3']
-
-                TFdiffa = abs(((tf1 - tf2) / ((tf1 + tf2) / 2)) * 100)
-                TFdiffb = abs(((tf1 - tf3) / ((tf1 + tf3) / 2)) * 100)
-                TFdiffe = abs(((tf2 - tf3) / ((tf2 + tf3) / 2)) * 100)
-
-                diff_thresh = storms.at[i, 'SecPrecip'] * metric
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values (adjustable threshhold with diff_thresh variable)
-                if f == 1:
-                    if storms.at[i, 'SecPrecip'] < 5:
-                        diff_thresh = small
-                    elif storms.at[i, 'SecPrecip'] < 10:
-                        diff_thresh = med
-                    elif storms.at[i, 'SecPrecip'] > 10:
-                        diff_thresh = large
-
-                # Remove storms that have too large variation in perc difference, meaning wide range in TF values based on linear function of storm size (adjustable threshhold with metric variable)
-                if g == 1:
-                    diff_thresh = storms.at[i, 'SecPrecip']*metric
-                    #print('diff_thresh:', diff_thresh)
-
-                if f == 1 or g == 1:
-                    if percDiffa > diff_thresh or percDiffb > diff_thresh or percDiffe > diff_thresh:
-                        storms.at[i, 'select_fg'] = 1
-
-                if h == 1:
-                    x = storms.at[i, 'SecPrecip']
-                    diff_thresh = A*math.exp(-x*B)+C
-                    if TFdiffa > diff_thresh or TFdiffb > diff_thresh or TFdiffe > diff_thresh:
-                        storms.at[i, 'select_h'] = 1
-
-            #remove storms with more than 2 zero TF readings
-            if q == 1:
-                if (TF1 + TF2 + TF3 + TF4 + TF5) < 3:
-                    storms.at[i, 'select_q'] = 1
-
-            # Remove storms where more than 1 TF collector exceeds highest% of SecPrecip
-            if e == 1:
-                measure = 0
-                if storms.at[i, 'SecPrecip'] < (highest*storms.at[i,'TF1']):
-                    measure = measure + 1
-                if storms.at[i, 'SecPrecip'] < (highest*storms.at[i,'TF2']):
-                    measure = measure + 1
-                if storms.at[i, 'SecPrecip'] < (highest*storms.at[i,'TF3']):
-                    measure = measure + 1
-                if storms.at[i, 'SecPrecip'] < (highest*storms.at[i,'TF4']):
-                    measure = measure + 1
-                if storms.at[i, 'SecPrecip'] < (highest*storms.at[i,'TF5']):
-                    measure = measure + 1
-                if measure > excess:
-                    storms.at[i, 'select_e'] = 1
-                    #print('i:', i, 'SecPrecip', storms.at[i, 'SecPrecip'], 'TF1:', storms.at[i, 'TF1'])
-
-            #print('select_a',storms.at[i,'select_a'])
-
-            if storms.at[i, 'select_a'] != 1 and storms.at[i, 'select_b'] == 0 and storms.at[i, 'select_c'] == 0 and storms.at[i, 'select_d'] == 0 and storms.at[i, 'select_e'] == 0 and storms.at[i, 'select_fg'] == 0 and storms.at[i, 'select_h'] == 0 and storms.at[i, 'select_p'] == 0 and storms.at[i, 'select_q'] == 0:
-                storms.at[i, 'select'] = 0
+        storms = load_storms(site, input_air, input_storm, fmt, cache_folder, air_catalog)
+        storms = apply_filters(storms, flags, params)
 
         path_check = Path(output_folder+'all_storms_'+site+'_filter_index.csv')
         if path_check.is_file() == True:
@@ -1504,6 +386,7 @@ def storm_select(Sites, input_air, input_storm, output_folder):
             ha = True
         ha = True
         selected.drop(selected.index[selected['select']!= 0], inplace=True)
+        count(selected=len(selected))
         selected.to_csv(output_folder+'Selected_storms_'+site+'.csv', header = ha, mode='w')
 
         #print('all storms', storms.head())
@@ -1512,28 +395,63 @@ def storm_select(Sites, input_air, input_storm, output_folder):
     print('Storm selection complete.')
     return(storms, selected)
 
-def plot_selected_storms(site, storms, output_folder,date):
+# This function evaluates every combination of the filter settings in grid on the storms
+# of each site. The per-storm features are computed once per site and the combinations
+# are evaluated in batches of (combinations x storms) masks.
+# Inputs: Sites, input_air, input_storm, fmt, cache_folder, air_catalog = see storm_select,
+# grid = dict of setting name -> list of values to try (e.g. {'temp_thresh': [0, 1, 2],
+# 'C': [50, 68]}, switches a-q can be included), flags, params = values of the settings not
+# in grid (None uses FILTER_FLAGS and FILTER_PARAMS), batch = number of combinations
+# evaluated at once
+# Output: dataframe with one row per site and combination: the settings in grid, the
+# number of storms and selected storms, and the mean and median IL_perc and the mean and
+# total IL_mm of the selected storms
+def sweep_filters(Sites, input_air, input_storm, grid, fmt='csv', cache_folder=None, flags=None, params=None,
+                  batch=1000, air_catalog=None):
+    base = dict(FILTER_FLAGS if flags is None else flags, **(FILTER_PARAMS if params is None else params))
+    names = list(grid)
+    settings = [dict(base, **dict(zip(names, values))) for values in itertools.product(*[grid[name] for name in names])]
+    results = []
+    for site in Sites:
+        storms = load_storms(site, input_air, input_storm, fmt, cache_folder, air_catalog)
+        features = storm_features(storms)
+        il_perc = storms['IL_perc'].to_numpy(dtype=float)
+        il_mm = storms['IL_mm'].to_numpy(dtype=float)
+        for start in range(0, len(settings), batch):
+            chunk = settings[start:start + batch]
+            masks = filter_masks(features, chunk)
+            removed = np.zeros((len(chunk), features['n']), dtype=bool)
+            for mask in masks.values():
+                removed |= mask
+            keep = ~removed & features['evaluated']
+            result = pd.DataFrame({name: [setting[name] for setting in chunk] for name in names})
+            result.insert(0, 'Site', site)
+            result['storms'] = features['n']
+            result['selected'] = keep.sum(axis=1)
+            with warnings.catch_warnings():
+                # combinations that select no storms give NaN
+                warnings.simplefilter('ignore', RuntimeWarning)
+                result['IL_perc_mean'] = np.nanmean(np.where(keep, il_perc, np.nan), axis=1)
+                result['IL_perc_median'] = np.nanmedian(np.where(keep, il_perc, np.nan), axis=1)
+                result['IL_mm_mean'] = np.nanmean(np.where(keep, il_mm, np.nan), axis=1)
+            result['IL_mm_total'] = np.where(keep, np.nan_to_num(il_mm), 0).sum(axis=1)
+            results.append(result)
+    return pd.concat(results, ignore_index=True)
+
+# This function plots all storms of a site with the storms removed by each filter, and the
+# selected storms.
+# Inputs: site = NEON site, storms = dataframe of storms from apply_filters, output_folder =
+# folder for the figure, date = date tag in the file name, flags = filter switches a-q
+# (None uses FILTER_FLAGS), only the filters switched on are shown
+def plot_selected_storms(site, storms, output_folder,date, flags=None):
     from matplotlib.ticker import FormatStrFormatter
-    selected_a = storms.copy()
-    selected_a.drop(selected_a.index[selected_a['select_a']==0], inplace = True)
-    selected_b = storms.copy()
-    selected_b.drop(selected_b.index[selected_b['select_b']==0], inplace = True)
-    selected_c = storms.copy()
-    selected_c.drop(selected_c.index[selected_c['select_c']==0], inplace = True)
-    selected_d = storms.copy()
-    selected_d.drop(selected_d.index[selected_d['select_d']==0], inplace = True)
-    selected_e = storms.copy()
-    selected_e.drop(selected_e.index[selected_e['select_e']==0], inplace = True)
-    selected_fg = storms.copy()
-    selected_fg.drop(selected_fg.index[selected_fg['select_fg']==0], inplace = True)
-    selected_h = storms.copy()
-    selected_h.drop(selected_h.index[selected_h['select_h']==0], inplace = True)
-    selected_p = storms.copy()
-    selected_p.drop(selected_p.index[selected_p['select_p']==0], inplace = True)
-    selected_q = storms.copy()
-    selected_q.drop(selected_q.index[selected_q['select_q']==0], inplace = True)
-    selected_all = storms.copy()
-    selected_all.drop(selected_all.index[selected_all['select']!=0], inplace = True)
+    flags = FILTER_FLAGS if flags is None else flags
+    # storms removed by each filter that is switched on
+    reasons = storms['reasons'].to_numpy(dtype=np.uint16) & enabled_bits(flags)
+    sec = storms['SecPrecip'].to_numpy()
+    il_perc = storms['IL_perc'].to_numpy()
+    selected = {name: (reasons & bit) != 0 for name, bit in FILTER_BITS.items()}
+    selected['all'] = storms['select'].to_numpy() == 0
 
     fig = plt.figure(num=1, figsize=(20, 12))
     gs = fig.add_gridspec(2,2)
@@ -1542,25 +460,25 @@ def plot_selected_storms(site, storms, output_folder,date):
     ax.set_title(None)
     ax2.set_title(None)
     ax.scatter(storms['SecPrecip'], storms['IL_perc'], s=120, c="black", marker='s', label='All Storms')
-    ax.scatter(selected_a['SecPrecip'], selected_a['IL_perc'], s=100, c="white", marker='s', edgecolors='black',
+    ax.scatter(sec[selected['a']], il_perc[selected['a']], s=100, c="white", marker='s', edgecolors='black',
                 linewidths=.3, label='Suspected snowfall')
-    ax.scatter(selected_b['SecPrecip'], selected_b['IL_perc'], s=65, c="lime", marker='<', edgecolors='black',
+    ax.scatter(sec[selected['b']], il_perc[selected['b']], s=65, c="lime", marker='<', edgecolors='black',
                 linewidths=.3, label='Not all TF collectors working in next storm')
-    ax.scatter(selected_c['SecPrecip'], selected_c['IL_perc'], s=60, c="orange", marker='v', edgecolors='black',
+    ax.scatter(sec[selected['c']], il_perc[selected['c']], s=60, c="orange", marker='v', edgecolors='black',
                 linewidths=.3, label='Not all TF collectors working in current storm')
-    ax.scatter(selected_p['SecPrecip'], selected_p['IL_perc'], s=55, c="magenta", marker='>', edgecolors='black',
+    ax.scatter(sec[selected['p']], il_perc[selected['p']], s=55, c="magenta", marker='>', edgecolors='black',
                 linewidths=.3, label='Not all TF collectors working in previous storm')
-    ax.scatter(selected_d['SecPrecip'], selected_d['IL_perc'], s=50, c="cyan",  marker='^', edgecolors='black',
+    ax.scatter(sec[selected['d']], il_perc[selected['d']], s=50, c="cyan",  marker='^', edgecolors='black',
                 linewidths=.3)  # label = 'Storms removed because of large variance across TF collectors')
-    ax.scatter(selected_fg['SecPrecip'], selected_fg['IL_perc'], s=50, c="cyan", marker='^', edgecolors='black',
+    ax.scatter(sec[selected['fg']], il_perc[selected['fg']], s=50, c="cyan", marker='^', edgecolors='black',
                 linewidths=.3)  # , label = 'Storms removed because of large variance across TF collectors')
-    ax.scatter(selected_h['SecPrecip'], selected_h['IL_perc'], s=50, c="cyan", marker='^',edgecolors='black',
+    ax.scatter(sec[selected['h']], il_perc[selected['h']], s=50, c="cyan", marker='^',edgecolors='black',
                 linewidths=.3, label='Too large variance across TF collectors')
-    ax.scatter(selected_e['SecPrecip'], selected_e['IL_perc'], s=40, c="orange", marker='p', edgecolors='black',
+    ax.scatter(sec[selected['e']], il_perc[selected['e']], s=40, c="orange", marker='p', edgecolors='black',
                 linewidths=.3, label='More than 1 TF collector exceeds precip amount')
-    ax.scatter(selected_q['SecPrecip'], selected_q['IL_perc'], s=40, c="yellow", marker='d', edgecolors='black',
+    ax.scatter(sec[selected['q']], il_perc[selected['q']], s=40, c="yellow", marker='d', edgecolors='black',
                 linewidths=.3, label='More than 2 TF collectors with 0 values')  # , edgecolors='black', linewidths=.1)
-    ax.scatter(selected_all['SecPrecip'], selected_all['IL_perc'], s=10, c="red", marker='o', label='Remaining storms')
+    ax.scatter(sec[selected['all']], il_perc[selected['all']], s=10, c="red", marker='o', label='Remaining storms')
 
     ax.set_ylim([-10,110])
     ax.set_xlabel('Storm Size (mm)')
@@ -1570,7 +488,7 @@ def plot_selected_storms(site, storms, output_folder,date):
     ax.legend(loc='lower center', bbox_to_anchor=(.5, -.6))
 
    #ax2 = fig.add_subplot(2,2,(2,1))
-    ax2.scatter(selected_all['SecPrecip'], selected_all['IL_perc'], s=10, c="red", marker='o')
+    ax2.scatter(sec[selected['all']], il_perc[selected['all']], s=10, c="red", marker='o')
     ax2.set_xlabel('Storm Size (mm)')
     ax2.set_ylabel('Percent Interception Loss')
     ax2.set_title('Selected Storms at '+site)
@@ -1584,28 +502,28 @@ def plot_selected_storms(site, storms, output_folder,date):
     plt.show()
 
 
-main_dir = 'C:/Users/Abigail Sandquist/Box/IL/IL_Project/'
-#flatten files
-destination = main_dir+'NEON_Downloads/NEON_Temp/NEON_temp-air-single/'
-flatten(destination)
-
-#filter for the desired 30-min sensor 2 temp file
-source = destination
-destination_filter = main_dir+'NEON_Downloads/NEON_Temp/'
-filter_string = '020.030.SAAT_30min'
-filter(source, destination_filter, filter_string)
-
-Sites = ['ABBY','BART','BLAN', 'DEJU', 'DELA', 'DSNY', 'GRSM', 'GUAN', 'JERC', 'KONZ','LENO', 'MLBS', 'ORNL', 'OSBS','SERC', 'STEI','TEAK','TREE','UKFS','UNDE','WREF','YELL']
-date = 'jan23'
-#combine air temp files for each site
-path = destination_filter
-output_folder = main_dir+'Combined/Temp/'
-combine_air(Sites, path, output_folder)
-
-#Filter to get selected storms for each site
-input_air = output_folder
-input_storm = main_dir+'Staging/'
-output_folder_selected_storms = main_dir+'Selected_Storms/'
-storms, selected = storm_select(Sites, input_air, input_storm, output_folder_selected_storms)
-
-
+if __name__ == "__main__":
+    main_dir = 'C:/Users/Abigail Sandquist/Box/IL/IL_Project/'
+    # Define the path to the downloaded NEON air temperature data. The folder can hold the
+    # zip packages as downloaded, the monthly files are read straight out of them.
+    destination_filter = main_dir+'NEON_Downloads/NEON_Temp/'
+
+    Sites = ['ABBY','BART','BLAN', 'DEJU', 'DELA', 'DSNY', 'GRSM', 'GUAN', 'JERC', 'KONZ','LENO', 'MLBS', 'ORNL', 'OSBS','SERC', 'STEI','TEAK','TREE','UKFS','UNDE','WREF','YELL']
+    date = 'jan23'
+    # Format of the intermediate files: 'csv', or 'parquet' for typed columnar files
+    fmt = 'csv'
+    # Only read monthly air temp files that were not processed in an earlier run
+    incremental = True
+    #combine air temp files for each site
+    path = destination_filter
+    output_folder = main_dir+'Combined/Temp/'
+    catalog = load_catalog(path, output_folder+'catalog.json')
+    combine_air(Sites, path, output_folder, fmt, incremental, catalog)
+
+    #Filter to get selected storms for each site
+    input_air = output_folder
+    input_storm = main_dir+'Staging/'
+    output_folder_selected_storms = main_dir+'Selected_Storms/'
+    # memory-mapped cache of the air temp series
+    cache_folder = main_dir+'Cache/'
+    storms, selected = storm_select(Sites, input_air, input_storm, output_folder_selected_storms, fmt, cache_folder)
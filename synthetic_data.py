@@ -0,0 +1,151 @@
+import os
+import sys
+import zipfile
+import numpy as np
+import pandas as pd
+from neon_io import TIME_FORMAT
+## This program writes synthetic monthly NEON 30 minute files (PRIPRE, SECPRE, THRPRE and
+## SAAT) for any number of sites and years, named and laid out like a NEON download, so
+## the get_new_storms.py and stormselection.py stages can be run and timed without the
+## real data. The series include dry spells, storms, snow, collector outages (runs of
+## zeros), missing rows and missing months.
+
+# NEON data products written for every site: table -> (product, horver, value columns).
+# THRPRE is written once per collector with horver '00<n>.000'.
+SYNTHETIC_TABLES = {'PRIPRE_30min': ('DP1.00006.001', '900.000', 'priPrecip'),
+                    'SECPRE_30min': ('DP1.00006.001', '000.060', 'secPrecip'),
+                    'THRPRE_30min': ('DP1.00006.001', None, 'TFPrecip'),
+                    'SAAT_30min': ('DP1.00002.001', '000.020', 'tempSingle')}
+
+# Release tag in the synthetic file names.
+SYNTHETIC_RELEASE = '20230101T000000Z'
+
+# This function returns the file name NEON uses for one month of one table.
+def neon_name(domain, site, product, horver, table, month):
+    return 'NEON.'+domain+'.'+site+'.'+product+'.'+horver+'.030.'+table+'.'+month+'.basic.'+SYNTHETIC_RELEASE+'.csv'
+
+# This function returns a column that is 1 during runs that start at random with the
+# given chance per 30 minute slot and last on average mean_len slots.
+def random_runs(rng, n, chance, mean_len):
+    on = np.zeros(n, dtype=bool)
+    starts = np.flatnonzero(rng.random(n) < chance)
+    for start, length in zip(starts, rng.geometric(1 / mean_len, len(starts))):
+        on[start:start + length] = True
+    return on
+
+# This function builds the 30 minute series of one site: air temp, secondary and primary
+# precip and the TF of each collector.
+# Inputs: rng = numpy random generator, times = DatetimeIndex of the slot start times,
+# collectors = number of TF collectors, outage = share of the time each collector is out
+# (reads 0), missing = share of the rows missing from the files, storms_per_week = average
+# number of storms a week (lower for sites with sparse rainfall)
+def site_series(rng, times, collectors=5, outage=0.03, missing=0.002, storms_per_week=2):
+    n = len(times)
+    day = (times.dayofyear.to_numpy() - 1) / 365.25
+    hour = (times.hour.to_numpy() + times.minute.to_numpy() / 60) / 24
+    # seasonal and daily cycle, with slow weather swings and noise
+    weather = np.cumsum(rng.normal(0, 0.15, n))
+    weather -= pd.Series(weather).rolling(48 * 10, min_periods=1, center=True).mean().to_numpy()
+    air = 8 - 12 * np.cos(2 * np.pi * day) - 4 * np.cos(2 * np.pi * hour) + weather + rng.normal(0, 0.5, n)
+
+    # storms last around 8 hours, rain falls in bursts separated by dry slots inside each storm
+    wet = random_runs(rng, n, storms_per_week / (7 * 48), 16) & (rng.random(n) < 0.7)
+    sec = np.where(wet, rng.gamma(0.8, 1.2, n), 0.0)
+    pri = np.where(wet, sec * rng.normal(1.0, 0.05, n), 0.0).clip(0)
+
+    # interception loss is larger for small storms and falls with the canopy in winter,
+    # snow mostly stays in the canopy
+    canopy = 0.25 + 0.1 * np.sin(np.pi * day)
+    series = {'secPrecip': sec, 'priPrecip': pri, 'tempSingle': air}
+    for k in range(1, collectors + 1):
+        share = 1 - canopy * rng.uniform(0.6, 1.4)
+        tf = sec * np.clip(share + rng.normal(0, 0.15, n), 0, 1.3)
+        tf = np.where(air < 0, tf * 0.1, tf)
+        # a clogged or broken collector reads 0 for days to weeks
+        tf[random_runs(rng, n, outage / (48 * 10), 48 * 10)] = 0
+        series['TFPrecip' + str(k)] = tf
+    for name in series:
+        if name != 'tempSingle':
+            series[name] = series[name].round(3)
+        series[name][rng.random(n) < missing] = np.nan
+    return series
+
+# This function returns the frame of one month of one table, with the columns of the
+# NEON file.
+def month_frame(times, values, prefix):
+    frame = pd.DataFrame({'startDateTime': times.strftime(TIME_FORMAT),
+                          'endDateTime': (times + pd.Timedelta('30min')).strftime(TIME_FORMAT)})
+    if prefix == 'tempSingle':
+        frame['tempSingleMean'] = values.round(2)
+        frame['tempSingleMinimum'] = (values - 0.4).round(2)
+        frame['tempSingleMaximum'] = (values + 0.4).round(2)
+        frame['finalQF'] = np.where(np.isnan(values), 1, 0)
+    else:
+        frame[prefix + 'Bulk'] = values
+        frame[prefix + 'ExpUncert'] = 0.08
+        frame[prefix + 'RangeQAQCRpt'] = 'Pass'
+        frame[prefix + 'SciRvwQF'] = 0
+    return frame
+
+# This function writes the synthetic monthly files of a list of sites.
+# Inputs: folder = output folder, Sites = list of site codes, years = number of years per
+# site, start = first month ('YYYY-MM'), collectors = TF collectors per site, seed = random
+# seed (each site gets its own stream, so adding sites does not change the others),
+# missing_months = chance that a monthly file is missing, zipped = write each site month
+# into one zip file per folder, like the NEON download packages, instead of plain csv
+# files, air_folder = folder for the SAAT air temp files (None writes them to folder),
+# storms_per_week = average number of storms a week at every site
+# Output: list of the files written
+def write_sites(folder, Sites, years=1, start='2021-01', collectors=5, seed=0, missing_months=0.02, zipped=False,
+                air_folder=None, storms_per_week=2):
+    air_folder = folder if air_folder is None else air_folder
+    for path in {folder, air_folder}:
+        os.makedirs(path, exist_ok=True)
+    months = pd.period_range(start, periods=12 * years, freq='M')
+    times = pd.date_range(months[0].start_time, months[-1].end_time.floor('30min'), freq='30min', tz='UTC')
+    month_of = times.strftime('%Y-%m')
+    written = []
+    for number, site in enumerate(Sites):
+        rng = np.random.default_rng([seed, number])
+        domain = 'D%02d' % (number % 20 + 1)
+        series = site_series(rng, times, collectors, storms_per_week=storms_per_week)
+        for month in months.strftime('%Y-%m'):
+            rows = month_of == month
+            files = {folder: {}, air_folder: {}}
+            for table, (product, horver, prefix) in SYNTHETIC_TABLES.items():
+                if table == 'THRPRE_30min':
+                    parts = [('00' + str(k) + '.000', prefix + str(k), prefix) for k in range(1, collectors + 1)]
+                else:
+                    parts = [(horver, prefix, prefix)]
+                for part_horver, name, column_prefix in parts:
+                    if rng.random() < missing_months:
+                        continue
+                    destination = air_folder if table == 'SAAT_30min' else folder
+                    files[destination][neon_name(domain, site, product, part_horver, table, month)] = \
+                        month_frame(times[rows], series[name][rows], column_prefix)
+            for destination, frames in files.items():
+                if len(frames) == 0:
+                    continue
+                if zipped:
+                    product = 'DP1.00002.001' if destination == air_folder != folder else 'DP1.00006.001'
+                    path = os.path.join(destination, 'NEON.'+domain+'.'+site+'.'+product+'.'+month+'.basic.'
+                                        +SYNTHETIC_RELEASE+'.zip')
+                    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                        for name, frame in frames.items():
+                            archive.writestr(name, frame.to_csv(index=False))
+                    written.append(path)
+                else:
+                    for name, frame in frames.items():
+                        frame.to_csv(os.path.join(destination, name), index=False)
+                        written.append(os.path.join(destination, name))
+    return written
+
+
+if __name__ == "__main__":
+    # python synthetic_data.py <folder> <site,site,...> [years] [zip]
+    folder = sys.argv[1]
+    Sites = sys.argv[2].split(',')
+    years = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    zipped = len(sys.argv) > 4 and sys.argv[4] == 'zip'
+    files = write_sites(folder, Sites, years, zipped=zipped)
+    print(len(files), 'files written to', folder)